@@ -0,0 +1,23 @@
+-- Addresses the email service must not send to (hard bounces, spam reports, invalid mailboxes)
+CREATE TABLE IF NOT EXISTS public.email_suppressions (
+  email TEXT PRIMARY KEY,
+  reason TEXT,
+  source TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Only the email service may read or change suppressions. With RLS on and no policies,
+-- PostgREST requests made with the browser-facing anon key see nothing and can't write;
+-- the service uses the service role key (which bypasses RLS) or a direct Postgres connection.
+ALTER TABLE public.email_suppressions ENABLE ROW LEVEL SECURITY;
+
+DO $$
+BEGIN
+  IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'anon') THEN
+    REVOKE ALL ON public.email_suppressions FROM anon;
+  END IF;
+  IF EXISTS (SELECT 1 FROM pg_roles WHERE rolname = 'authenticated') THEN
+    REVOKE ALL ON public.email_suppressions FROM authenticated;
+  END IF;
+END
+$$;
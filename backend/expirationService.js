@@ -9,6 +9,11 @@ class ExpirationService {
 
   // Function to automatically expire listings that are past their end date
   async expireListings() {
+    // Let the Python email service run the set-based sweep and batched emails
+    if (process.env.EXPIRATION_SWEEP_OWNER === 'email-service') {
+      return this.expireListingsViaEmailService();
+    }
+
     try {
       // Get listings that are about to expire (for email notifications)
       const expiringListings = await this.pool.query(`
@@ -48,6 +53,25 @@ class ExpirationService {
     }
   }
 
+  async expireListingsViaEmailService() {
+    try {
+      const response = await fetch(`${this.emailNotifications.emailServiceUrl}/expire-listings`, {
+        method: 'POST',
+      });
+
+      if (!response.ok) {
+        console.error('Expiration sweep failed:', await response.text());
+        return;
+      }
+
+      // The sweep runs in the background; progress is at /expire-listings/status
+      const result = await response.json();
+      console.log(`[${new Date().toISOString()}] Expiration sweep ${result.status} on the email service (started ${result.started_at})`);
+    } catch (err) {
+      console.error('Error running expiration sweep via email service:', err);
+    }
+  }
+
   // Start the scheduled job to check for expired listings every hour
   startScheduledExpiration() {
     // Run every hour at minute 0
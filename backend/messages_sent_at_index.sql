@@ -0,0 +1,4 @@
+-- Supports the email service's poll query (range scan on sent_at, stable ordering by id).
+-- CONCURRENTLY doesn't block message inserts while the index builds; run it outside a transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS messages_sent_at_id_idx
+  ON public.messages (sent_at, id);
@@ -1,16 +1,50 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from fastapi import FastAPI, HTTPException, Request, Depends, Header, Query
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from sendgrid.helpers.eventwebhook import EventWebhook
+from pydantic import BaseModel, Field, TypeAdapter
+from typing import Optional, Dict, Any, Literal, Union
+from typing_extensions import Annotated
 from email_service import email_service
-from database import db
+from database import async_db
+from expiration_service import expiration_service
+from ingest import DuplexStreamingResponse, ingest_ndjson, notification_queue
+from shared_state import shared_state
+from suppression import suppression_list
+from scheduler import delivery_scheduler
+from circuit_breaker import OPEN
+from profiling import stack_sampler, memory_tracker, format_collapsed
+from process_snapshots import process_snapshots
+from config import config
+from logging_setup import configure_logging
+from contextlib import asynccontextmanager
+from datetime import datetime
+import hmac
+import json
+import time
 import logging
 
+# API worker processes started by uvicorn import this module, not main.py
+configure_logging()
 logger = logging.getLogger(__name__)
 
+# Verifies signed SendGrid event webhooks when a public key is configured
+sendgrid_webhook = EventWebhook(config.SENDGRID_WEBHOOK_PUBLIC_KEY) if config.SENDGRID_WEBHOOK_PUBLIC_KEY else None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    process_snapshots.start('api')
+    # Load suppressions in the background before the first send needs them
+    suppression_list.start()
+    yield
+    # Release pooled Supabase connections on shutdown
+    await async_db.close()
+
 app = FastAPI(
     title="Subly Email Service",
     description="Email notification service for Subly platform",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 class MessageNotificationRequest(BaseModel):
@@ -48,9 +82,39 @@ class ListingExpiredRequest(BaseModel):
     expiration_date: str
     dashboard_url: str
 
+# Typed events accepted by the NDJSON ingestion endpoint
+class MessageNotificationEvent(MessageNotificationRequest):
+    type: Literal["message"]
+
+class ListingAddedEvent(ListingNotificationRequest):
+    type: Literal["listing_added"]
+
+class ListingEditedEvent(ListingNotificationRequest):
+    type: Literal["listing_edited"]
+
+class ListingDeletedEvent(ListingDeletedRequest):
+    type: Literal["listing_deleted"]
+
+class ListingExpiredEvent(ListingExpiredRequest):
+    type: Literal["listing_expired"]
+
+NotificationEvent = Annotated[
+    Union[MessageNotificationEvent, ListingAddedEvent, ListingEditedEvent, ListingDeletedEvent, ListingExpiredEvent],
+    Field(discriminator="type")
+]
+notification_event_adapter = TypeAdapter(NotificationEvent)
+
+class ScheduleRequest(BaseModel):
+    event: NotificationEvent
+    send_at: Optional[datetime] = None
+    delay_seconds: Optional[float] = Field(None, ge=0)
+    # Skip the send if this message has been read by then
+    unless_read_message_id: Optional[str] = None
+
 class HealthResponse(BaseModel):
     status: str
     message: str
+    breakers: Dict[str, Dict[str, Any]] = {}
 
 @app.get("/", response_model=HealthResponse)
 async def root():
@@ -62,10 +126,18 @@ async def root():
 
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
-    """Health check endpoint"""
+    """Health check endpoint, with the state of each dependency's circuit breaker in any process"""
+    breakers = await run_in_threadpool(process_snapshots.breakers)
+    if any(breaker['state'] == OPEN for breaker in breakers.values()):
+        return HealthResponse(
+            status="degraded",
+            message="One or more dependencies are failing fast",
+            breakers=breakers
+        )
     return HealthResponse(
         status="healthy",
-        message="Email service is operational"
+        message="Email service is operational",
+        breakers=breakers
     )
 
 @app.post("/send-message-notification")
@@ -81,6 +153,8 @@ async def send_message_notification(request: MessageNotificationRequest):
 
         if success:
             return {"status": "success", "message": "Email sent successfully"}
+        elif suppression_list.is_suppressed(request.recipient_email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send email")
 
@@ -105,6 +179,8 @@ async def send_listing_added_notification(request: ListingNotificationRequest):
 
         if success:
             return {"status": "success", "message": "Listing added notification sent successfully"}
+        elif suppression_list.is_suppressed(request.recipient_email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send email")
 
@@ -129,6 +205,8 @@ async def send_listing_edited_notification(request: ListingNotificationRequest):
 
         if success:
             return {"status": "success", "message": "Listing edited notification sent successfully"}
+        elif suppression_list.is_suppressed(request.recipient_email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send email")
 
@@ -152,6 +230,8 @@ async def send_listing_deleted_notification(request: ListingDeletedRequest):
 
         if success:
             return {"status": "success", "message": "Listing deleted notification sent successfully"}
+        elif suppression_list.is_suppressed(request.recipient_email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send email")
 
@@ -176,6 +256,8 @@ async def send_listing_expired_notification(request: ListingExpiredRequest):
 
         if success:
             return {"status": "success", "message": "Listing expired notification sent successfully"}
+        elif suppression_list.is_suppressed(request.recipient_email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send email")
 
@@ -183,6 +265,95 @@ async def send_listing_expired_notification(request: ListingExpiredRequest):
         logger.error(f"Error sending listing expired notification: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/ingest/notifications")
+async def ingest_notifications(request: Request):
+    """Stream NDJSON notification events in and per-line results out"""
+    return DuplexStreamingResponse(
+        ingest_ndjson(request.stream(), notification_event_adapter.validate_json, notification_queue),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/ingest/stats")
+def ingest_stats():
+    """Counters for the ingestion send queue (pending is for this process only)"""
+    return {**shared_state.metrics('ingest_'), "pending": notification_queue.queue.qsize()}
+
+@app.get("/metrics")
+def metrics():
+    """Counters aggregated across all service processes"""
+    return shared_state.metrics()
+
+@app.get("/providers")
+def providers():
+    """Rolling latency and error estimates per email provider, in routing order, for this and every other process"""
+    processes = process_snapshots.processes()
+    return {
+        **processes[process_snapshots.label]['providers'],
+        'processes': {label: snapshot['providers'] for label, snapshot in processes.items()}
+    }
+
+@app.post("/expire-listings", status_code=202)
+def expire_listings():
+    """Start expiring listings past their end date and notifying hosts; poll /expire-listings/status"""
+    return expiration_service.start()
+
+@app.get("/expire-listings/status")
+def expire_listings_status():
+    """Progress of the current or last expiration sweep, whichever process runs it"""
+    return expiration_service.status()
+
+@app.post("/webhooks/sendgrid/events")
+async def sendgrid_events(
+    request: Request,
+    signature: Optional[str] = Header(None, alias="X-Twilio-Email-Event-Webhook-Signature"),
+    timestamp: Optional[str] = Header(None, alias="X-Twilio-Email-Event-Webhook-Timestamp")
+):
+    """Record bounces, drops and spam reports from the SendGrid event webhook as suppressions"""
+    payload = (await request.body()).decode()
+    if sendgrid_webhook:
+        try:
+            verified = bool(signature and timestamp) and sendgrid_webhook.verify_signature(payload, signature, timestamp)
+        except Exception:
+            verified = False
+        if not verified:
+            raise HTTPException(status_code=403, detail="Invalid webhook signature")
+    elif not config.SENDGRID_WEBHOOK_ALLOW_UNSIGNED:
+        # Anyone who can reach the endpoint could otherwise suppress arbitrary addresses
+        raise HTTPException(status_code=403, detail="Webhook verification key is not configured")
+    try:
+        events = json.loads(payload)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Payload must be a JSON array of events")
+    if not isinstance(events, list):
+        raise HTTPException(status_code=400, detail="Payload must be a JSON array of events")
+    added = await run_in_threadpool(suppression_list.record_sendgrid_events, [e for e in events if isinstance(e, dict)])
+    return {"status": "success", "events": len(events), "suppressed": added}
+
+@app.post("/schedule")
+def schedule_notification(request: ScheduleRequest):
+    """Schedule a notification for later delivery"""
+    if request.send_at is not None:
+        due_at = request.send_at.timestamp()
+    else:
+        due_at = time.time() + (request.delay_seconds or 0)
+    condition = {'unread_message_id': request.unless_read_message_id} if request.unless_read_message_id else None
+    job_id = delivery_scheduler.schedule(
+        request.event.type, request.event.model_dump(exclude={'type'}), due_at, condition
+    )
+    return {"status": "scheduled", "job_id": job_id, "due_at": datetime.fromtimestamp(due_at).isoformat()}
+
+@app.delete("/schedule/{job_id}")
+def cancel_scheduled_notification(job_id: str):
+    """Cancel a scheduled notification that has not been sent yet"""
+    if not delivery_scheduler.cancel(job_id):
+        raise HTTPException(status_code=404, detail="Scheduled notification not found")
+    return {"status": "cancelled", "job_id": job_id}
+
+@app.get("/schedule/stats")
+def schedule_stats():
+    """Pending scheduled notifications and release counters"""
+    return delivery_scheduler.stats()
+
 @app.post("/send-test-email")
 async def send_test_email(email: str):
     """Send a test email for debugging"""
@@ -196,6 +367,8 @@ async def send_test_email(email: str):
         
         if success:
             return {"status": "success", "message": "Test email sent successfully"}
+        elif suppression_list.is_suppressed(email):
+            return {"status": "suppressed", "message": "Recipient is on the suppression list"}
         else:
             raise HTTPException(status_code=500, detail="Failed to send test email")
             
@@ -209,6 +382,7 @@ async def get_config():
     from config import config
     return {
         "email_provider": email_service.provider,
+        "email_providers": list(email_service.router.providers),
         "from_email": email_service.from_email,
         "from_name": email_service.from_name,
         "smtp_host": config.SMTP_HOST,
@@ -227,7 +401,7 @@ async def debug_messages():
         from datetime import datetime, timedelta
         last_24h = (datetime.now() - timedelta(hours=24)).isoformat()
         
-        messages = db.get_new_messages(last_24h)
+        messages = await async_db.get_new_messages(last_24h)
         
         return {
             "status": "success",
@@ -242,9 +416,53 @@ async def debug_messages():
             "error": str(e)
         }
 
+def require_debug_token(x_debug_token: Optional[str] = Header(None)):
+    """Profiling endpoints are off unless DEBUG_TOKEN is set, and then need it in X-Debug-Token"""
+    if not config.DEBUG_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest((x_debug_token or '').encode(), config.DEBUG_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid debug token")
+
+@app.get("/debug/profile", dependencies=[Depends(require_debug_token)])
+def debug_profile(seconds: float = 10, interval_ms: float = 5):
+    """Sample every thread's stack for N seconds and return flamegraph collapsed stacks"""
+    seconds = min(max(seconds, 0.1), config.DEBUG_PROFILE_MAX_SECONDS)
+    counts = stack_sampler.sample(seconds, max(interval_ms, 1) / 1000)
+    if counts is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return PlainTextResponse(format_collapsed(counts))
+
+@app.get("/debug/memory", dependencies=[Depends(require_debug_token)])
+def debug_memory(
+    action: Literal["start", "top", "diff", "stop"] = "top",
+    limit: int = Query(25, ge=1, le=500),
+    frames: int = Query(1, ge=1, le=64)
+):
+    """Control tracemalloc and return top allocation sites or growth since the last diff"""
+    if action == "start":
+        return memory_tracker.start(frames)
+    if action == "stop":
+        return memory_tracker.stop()
+    if not memory_tracker.tracing:
+        raise HTTPException(status_code=409, detail="tracemalloc is not running, call with action=start first")
+    if action == "diff":
+        return memory_tracker.diff(limit)
+    return memory_tracker.top(limit)
+
+@app.get("/debug/phases", dependencies=[Depends(require_debug_token)])
+def debug_phases(reset: bool = False):
+    """Cumulative timings for the poll, lookup, render and send phases, summed across processes"""
+    timings = process_snapshots.phases()
+    if reset:
+        process_snapshots.reset_phases()
+    return timings
+
 @app.post("/debug/check-worker")
 async def debug_check_worker():
     """Manually trigger the notification worker check"""
+    if config.SERVING_MODE == "multiprocess":
+        # The poller runs in its own process; polling here would be a second poller with its own dedup state
+        raise HTTPException(status_code=409, detail="Not available in multiprocess mode; the worker process polls on its own schedule")
     try:
         from notification_worker import notification_worker
         
@@ -0,0 +1,140 @@
+from config import config
+from typing import Dict, Any, Optional
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name: str):
+        super().__init__(f"circuit breaker '{name}' is open")
+        self.name = name
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker for one outbound dependency.
+
+    Opens after `failure_threshold` consecutive failures, rejects calls for
+    `recovery_timeout` seconds, then lets `half_open_calls` trial calls through;
+    a successful trial closes it again and a failed one re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float, half_open_calls: int = 1):
+        self._lock = threading.Lock()
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_calls = half_open_calls
+        self._state = CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trials = 0
+        self.rejected = 0
+
+    def _current_state(self) -> str:
+        # opened_at doubles as the start of the half-open window, so trials that
+        # never report back are handed out again after another recovery_timeout
+        if self._state != CLOSED and time.monotonic() - self.opened_at >= self.recovery_timeout:
+            if self._state == OPEN:
+                logger.info("Circuit breaker %s half-open", self.name)
+            self._state = HALF_OPEN
+            self.opened_at = time.monotonic()
+            self.trials = 0
+        return self._state
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def available(self) -> bool:
+        """Whether a call would currently be let through, without reserving a trial"""
+        with self._lock:
+            state = self._current_state()
+            return state == CLOSED or (state == HALF_OPEN and self.trials < self.half_open_calls)
+
+    def allow(self) -> bool:
+        """Admit a call; in half-open state this uses up one trial slot"""
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self.trials < self.half_open_calls:
+                self.trials += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self):
+        """Admit a call or raise CircuitOpenError"""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+
+    def record_success(self):
+        with self._lock:
+            state = self._current_state()
+            if state == OPEN:
+                # A slow call that started before the breaker opened; only a half-open trial may close it
+                return
+            if state == HALF_OPEN:
+                logger.info("Circuit breaker %s closed", self.name)
+            self._state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            state = self._current_state()
+            if state == HALF_OPEN or (state == CLOSED and self.failures >= self.failure_threshold):
+                self._state = OPEN
+                self.opened_at = time.monotonic()
+                logger.warning("Circuit breaker %s opened after %d failures", self.name, self.failures)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == OPEN:
+                retry_in = round(max(0.0, self.recovery_timeout - (time.monotonic() - self.opened_at)), 1)
+            return {
+                'state': state,
+                'failures': self.failures,
+                'rejected': self.rejected,
+                'retry_in_s': retry_in
+            }
+
+class BreakerRegistry:
+    """One breaker per dependency name, created on first use with the configured thresholds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            if name not in self.breakers:
+                self.breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+                    recovery_timeout=config.BREAKER_RECOVERY_SECONDS,
+                    half_open_calls=config.BREAKER_HALF_OPEN_CALLS
+                )
+            return self.breakers[name]
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return {breaker.name: breaker.snapshot() for breaker in breakers}
+
+    def any_open(self) -> bool:
+        with self._lock:
+            breakers = list(self.breakers.values())
+        return any(breaker.state == OPEN for breaker in breakers)
+
+circuit_breakers = BreakerRegistry()
@@ -10,16 +10,48 @@ class Config:
     # Supabase Configuration (from existing backend .env)
     SUPABASE_URL = os.getenv("NEXT_PUBLIC_SUPABASE_URL")
     SUPABASE_KEY = os.getenv("NEXT_PUBLIC_SUPABASE_ANON_KEY")
-    
+    # Server-only key for tables closed to anon by RLS (email_suppressions); never ship it to browsers
+    SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+
+    # Supabase HTTP transport (timeouts in seconds)
+    SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+    SUPABASE_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_CONNECT_TIMEOUT", "5"))
+    SUPABASE_POOL_SIZE = int(os.getenv("SUPABASE_POOL_SIZE", "20"))
+    SUPABASE_KEEPALIVE_CONNECTIONS = int(os.getenv("SUPABASE_KEEPALIVE_CONNECTIONS", "10"))
+    SUPABASE_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_KEEPALIVE_EXPIRY", "30"))
+    SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "true").lower() == "true"
+
+    # Database backend (supabase or postgres)
+    DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "supabase")
+    DATABASE_URL = os.getenv("DATABASE_URL")
+    DATABASE_POOL_MIN = int(os.getenv("DATABASE_POOL_MIN", "1"))
+    DATABASE_POOL_MAX = int(os.getenv("DATABASE_POOL_MAX", "10"))
+    DATABASE_CONNECT_TIMEOUT = int(os.getenv("DATABASE_CONNECT_TIMEOUT", "5"))  # Seconds to connect or acquire a pooled connection
+    DATABASE_STATEMENT_TIMEOUT = float(os.getenv("DATABASE_STATEMENT_TIMEOUT", "10"))  # Seconds before Postgres cancels a query
+
     # Email Configuration (using Subly email)
     SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
     SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
     SMTP_USER = os.getenv("SMTP_USER", "subly.founder@gmail.com")
     SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")  # You'll need to add this to your .env
+    SMTP_TIMEOUT = float(os.getenv("SMTP_TIMEOUT", "15"))
     
     # SendGrid Configuration (optional)
     SENDGRID_API_KEY = os.getenv("SENDGRID_API_KEY")
     SENDGRID_FROM_EMAIL = os.getenv("SENDGRID_FROM_EMAIL")
+    SENDGRID_TIMEOUT = float(os.getenv("SENDGRID_TIMEOUT", "10"))
+    
+    SENDGRID_WEBHOOK_PUBLIC_KEY = os.getenv("SENDGRID_WEBHOOK_PUBLIC_KEY")  # Signed Event Webhook verification key
+    # Without a verification key, unsigned webhook requests are rejected unless this is set (local testing only)
+    SENDGRID_WEBHOOK_ALLOW_UNSIGNED = os.getenv("SENDGRID_WEBHOOK_ALLOW_UNSIGNED", "false").lower() == "true"
+    
+    # Suppressed recipients are reloaded from email_suppressions this often
+    SUPPRESSION_REFRESH_SECONDS = float(os.getenv("SUPPRESSION_REFRESH_SECONDS", "300"))
+    
+    # Circuit breakers around Supabase, Postgres and email providers
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+    BREAKER_RECOVERY_SECONDS = float(os.getenv("BREAKER_RECOVERY_SECONDS", "30"))
+    BREAKER_HALF_OPEN_CALLS = int(os.getenv("BREAKER_HALF_OPEN_CALLS", "1"))
     
     # Redis Configuration
     REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
@@ -28,6 +60,23 @@ class Config:
     HOST = os.getenv("EMAIL_SERVICE_HOST", "0.0.0.0")
     PORT = int(os.getenv("PORT", "8001"))
     
+    # Serving mode: single (API and worker in one process) or multiprocess
+    SERVING_MODE = os.getenv("SERVING_MODE", "single")
+    API_WORKERS = int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1)))
+    
+    # State shared across processes (memory or redis)
+    SHARED_STATE_BACKEND = os.getenv("SHARED_STATE_BACKEND", "memory")
+    SHARED_STATE_TIMEOUT = float(os.getenv("SHARED_STATE_TIMEOUT", "2"))
+    PROCESSED_TTL_SECONDS = int(os.getenv("PROCESSED_TTL_SECONDS", "86400"))
+    # Each process publishes its breakers, provider stats and phase timings this often
+    SNAPSHOT_PUBLISH_SECONDS = float(os.getenv("SNAPSHOT_PUBLISH_SECONDS", "10"))
+    
+    # Logging: plain (blocking, text) or async (queue listener thread, JSON lines)
+    LOG_MODE = os.getenv("LOG_MODE", "plain")
+    LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+    LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    LOG_INFO_RATE = float(os.getenv("LOG_INFO_RATE", "5"))
+    
     # Email Settings
     EMAIL_FROM_NAME = os.getenv("EMAIL_FROM_NAME", "Subly")
     EMAIL_FROM_ADDRESS = os.getenv("EMAIL_FROM_ADDRESS", "subly.founder@gmail.com")
@@ -35,6 +84,46 @@ class Config:
     # Email Provider (smtp or sendgrid)
     EMAIL_PROVIDER = os.getenv("EMAIL_PROVIDER", "smtp")
     
+    # Providers to route between, in order of preference (smtp, sendgrid, sink)
+    EMAIL_PROVIDERS = [name.strip() for name in os.getenv("EMAIL_PROVIDERS", EMAIL_PROVIDER).split(",") if name.strip()]
+    ROUTING_DEFAULT_LATENCY = float(os.getenv("ROUTING_DEFAULT_LATENCY", "1"))
+    ROUTING_ERROR_PENALTY = float(os.getenv("ROUTING_ERROR_PENALTY", "10"))
+    ROUTING_ERROR_HALF_LIFE = float(os.getenv("ROUTING_ERROR_HALF_LIFE", "60"))
+    EMAIL_HEDGE_ENABLED = os.getenv("EMAIL_HEDGE_ENABLED", "false").lower() == "true"
+    EMAIL_HEDGE_MIN_SAMPLES = int(os.getenv("EMAIL_HEDGE_MIN_SAMPLES", "20"))
+    EMAIL_HEDGE_WORKERS = int(os.getenv("EMAIL_HEDGE_WORKERS", "8"))
+    
+    # Characters of the message body included in notification emails
+    MESSAGE_PREVIEW_LENGTH = int(os.getenv("MESSAGE_PREVIEW_LENGTH", "100"))
+    
+    # Listing expiration sweep
+    EXPIRATION_BATCH_SIZE = int(os.getenv("EXPIRATION_BATCH_SIZE", "100"))
+    
+    # Streaming NDJSON ingestion
+    INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "10000"))
+    INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+    INGEST_ENQUEUE_TIMEOUT = float(os.getenv("INGEST_ENQUEUE_TIMEOUT", "30"))
+    INGEST_MAX_LINE_BYTES = int(os.getenv("INGEST_MAX_LINE_BYTES", "65536"))
+    
+    # Delayed delivery: job store (sqlite or redis) and release loop
+    SCHEDULE_STORE = os.getenv("SCHEDULE_STORE", "sqlite")
+    SCHEDULE_DB_PATH = os.getenv("SCHEDULE_DB_PATH", "scheduled_emails.db")
+    SCHEDULER_HORIZON_SECONDS = float(os.getenv("SCHEDULER_HORIZON_SECONDS", "60"))
+    SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", "5"))
+    SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", "100"))
+    SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", "300"))
+    SCHEDULER_MAX_ATTEMPTS = int(os.getenv("SCHEDULER_MAX_ATTEMPTS", "3"))
+    
+    # Send message notifications only if still unread after this many minutes (0 sends immediately)
+    MESSAGE_NOTIFICATION_DELAY_MINUTES = float(os.getenv("MESSAGE_NOTIFICATION_DELAY_MINUTES", "0"))
+    
+    # Spread expiration emails evenly over this many minutes (0 sends immediately)
+    EXPIRATION_SPREAD_MINUTES = float(os.getenv("EXPIRATION_SPREAD_MINUTES", "0"))
+    
+    # Profiling endpoints (/debug/profile, /debug/memory, /debug/phases), disabled unless set
+    DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+    DEBUG_PROFILE_MAX_SECONDS = float(os.getenv("DEBUG_PROFILE_MAX_SECONDS", "60"))
+    
     # Frontend URL (from existing backend .env)
     FRONTEND_URL = os.getenv("FRONTEND_URL")
     if not FRONTEND_URL:
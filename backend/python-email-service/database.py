@@ -1,20 +1,27 @@
-from supabase import create_client, Client
+from transport import create_rest_client, create_async_rest_client
 from config import config
-from typing import List, Dict, Any, Optional
+from profiling import phase_timings
+from records import UserRecord, MessageNotification, USER_COLUMNS, MESSAGE_COLUMNS, make_preview
+from typing import List, Dict, Any, Optional, Iterator, Set, Callable, Tuple
+from datetime import date
+import asyncio
 import logging
 
 logger = logging.getLogger(__name__)
 
 class Database:
     def __init__(self):
-        self.supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_KEY)
+        # Pooled PostgREST client with explicit per-query timeouts
+        self.rest = create_rest_client()
+        # email_suppressions is closed to anon by RLS, so it is only reachable with the service role key
+        self.service_rest = create_rest_client(config.SUPABASE_SERVICE_ROLE_KEY) if config.SUPABASE_SERVICE_ROLE_KEY else None
     
-    def get_user_by_id(self, user_id: str) -> Optional[Dict[str, Any]]:
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
         """Get user information by user ID"""
         try:
-            response = self.supabase.table('users').select('*').eq('id', user_id).execute()
+            response = self.rest.from_('users').select(USER_COLUMNS).eq('id', user_id).execute()
             if response.data:
-                return response.data[0]
+                return UserRecord.from_row(response.data[0])
             return None
         except Exception as e:
             logger.error(f"Error getting user {user_id}: {e}")
@@ -24,17 +31,17 @@ class Database:
         """Get new messages since last check"""
         try:
             # Get all messages since last check time (no email_sent filtering)
-            response = self.supabase.table('messages').select('*').gte('sent_at', last_check_time).execute()
-            logger.info(f"Found {len(response.data)} recent messages since {last_check_time}")
+            response = self.rest.from_('messages').select(MESSAGE_COLUMNS).gte('sent_at', last_check_time).execute()
+            logger.info("Found %d recent messages since %s", len(response.data), last_check_time)
             return response.data
         except Exception as e:
-            logger.error(f"Error getting new messages: {e}")
+            logger.error("Error getting new messages: %s", e)
             return []
     
-    def get_conversation_participants(self, conversation_id: str) -> List[Dict[str, Any]]:
+    def get_conversation_participants(self, conversation_id: str) -> List[UserRecord]:
         """Get participants of a conversation"""
         try:
-            response = self.supabase.table('conversations').select('*').eq('id', conversation_id).execute()
+            response = self.rest.from_('conversations').select('guest_id,host_id').eq('id', conversation_id).execute()
             if response.data:
                 conversation = response.data[0]
                 # Get participants (guest_id and host_id)
@@ -53,9 +60,204 @@ class Database:
             logger.error(f"Error getting conversation participants: {e}")
             return []
     
+    def get_new_message_notifications(self, last_check_time: str, is_processed: Optional[Callable[[str], bool]] = None) -> Tuple[int, Iterator[MessageNotification]]:
+        """Get the number of new message rows and their notifications.
+
+        Sender and recipient are looked up lazily as records are consumed, and
+        messages for which `is_processed` is true are skipped before any lookup.
+        """
+        messages = self.get_new_messages(last_check_time)
+        # Drop full bodies as soon as the rows are loaded
+        for message in messages:
+            message['body'] = make_preview(message['body'])
+        return len(messages), self._resolve_notifications(messages, is_processed)
+
+    def _resolve_notifications(self, messages: List[Dict[str, Any]], is_processed: Optional[Callable[[str], bool]]) -> Iterator[MessageNotification]:
+        for message in messages:
+            if is_processed and is_processed(message['id']):
+                continue
+            with phase_timings.span('lookup'):
+                sender = self.get_user_by_id(message['sender_id'])
+                participants = self.get_conversation_participants(message['conversation_id']) if sender else []
+            if not sender:
+                logger.error("Sender %s not found for message %s", message['sender_id'], message['id'])
+                continue
+            recipient = next((p for p in participants if p.id != message['sender_id']), None)
+            if not recipient:
+                logger.error("No recipient found for message %s", message['id'])
+                continue
+            yield MessageNotification(
+                id=message['id'],
+                conversation_id=message['conversation_id'],
+                sender_name=sender.name,
+                recipient_id=recipient.id,
+                recipient_email=recipient.email,
+                preview=message['body']
+            )
+
+    def expire_listings(self) -> List[Dict[str, Any]]:
+        """Mark listings past their end date inactive in bulk and return them with host name and email.
+
+        Listings whose host could not be looked up are still returned, with an empty host_email.
+        """
+        try:
+            query = (
+                self.rest.from_('listings')
+                .update({'status': 'inactive'})
+                .lte('end_date', date.today().isoformat())
+            )
+            # One UPDATE, so the status change has a single commit point
+            query.params = query.params.add('or', '(status.is.null,status.in.(active,approved))')
+            expired = query.execute().data
+        except Exception as e:
+            logger.error("Error expiring listings: %s", e)
+            return []
+        logger.info("Expired %d listings", len(expired))
+        
+        # The listings are already inactive; from here on keep every row even if enrichment fails
+        host_ids = list({listing['user_id'] for listing in expired})
+        hosts = {}
+        failed_lookups = 0
+        for start in range(0, len(host_ids), 200):
+            chunk = host_ids[start:start + 200]
+            try:
+                response = self.rest.from_('users').select('id,name,email').in_('id', chunk).execute()
+                hosts.update({host['id']: host for host in response.data})
+            except Exception as e:
+                failed_lookups += len(chunk)
+                logger.error("Error looking up %d listing hosts: %s", len(chunk), e)
+        if failed_lookups:
+            logger.error("Could not look up %d of %d hosts for expired listings", failed_lookups, len(host_ids))
+        
+        rows = []
+        for listing in expired:
+            host = hosts.get(listing['user_id']) or {}
+            rows.append({**listing, 'host_name': host.get('name'), 'host_email': host.get('email')})
+        return rows
+
     def mark_message_notified(self, message_id: str):
         """Log that a message notification was sent (no database tracking)"""
         # Since we're not using email_sent column, just log it
-        logger.info(f"Email notification sent for message {message_id} (not tracked in database)")
+        logger.info("Email notification sent for message %s (not tracked in database)", message_id)
+
+    def get_unread_message_ids(self, message_ids: List[str]) -> Optional[Set[str]]:
+        """Get which of the given messages are still unread, or None if they could not be checked"""
+        try:
+            unread = set()
+            for start in range(0, len(message_ids), 200):
+                response = (
+                    self.rest.from_('messages')
+                    .select('id')
+                    .in_('id', message_ids[start:start + 200])
+                    .is_('read_at', 'null')
+                    .execute()
+                )
+                unread.update(row['id'] for row in response.data)
+            return unread
+        except Exception as e:
+            logger.error(f"Error checking unread messages: {e}")
+            return None
+
+    def get_suppressed_emails(self) -> Optional[List[str]]:
+        """Get every suppressed recipient address, or None if the table could not be read"""
+        if not self.service_rest:
+            logger.error("SUPABASE_SERVICE_ROLE_KEY is not set; cannot read email_suppressions")
+            return None
+        try:
+            emails = []
+            page_size = 1000
+            while True:
+                response = (
+                    self.service_rest.from_('email_suppressions')
+                    .select('email')
+                    .order('email')
+                    .range(len(emails), len(emails) + page_size - 1)
+                    .execute()
+                )
+                emails.extend(row['email'] for row in response.data)
+                if len(response.data) < page_size:
+                    return emails
+        except Exception as e:
+            logger.error(f"Error getting suppressed emails: {e}")
+            return None
+
+    def add_suppression(self, email: str, reason: str, source: str) -> bool:
+        """Persist a suppressed recipient, keeping the first recorded reason"""
+        if not self.service_rest:
+            logger.error("SUPABASE_SERVICE_ROLE_KEY is not set; suppression for %s is kept in memory only", email)
+            return False
+        try:
+            self.service_rest.from_('email_suppressions').upsert(
+                {'email': email, 'reason': reason, 'source': source},
+                ignore_duplicates=True,
+                on_conflict='email'
+            ).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error adding suppression for {email}: {e}")
+            return False
+
+    def close(self):
+        """Release pooled connections"""
+        self.rest.aclose()
+        if self.service_rest:
+            self.service_rest.aclose()
+
+class AsyncDatabase:
+    """Non-blocking variant of Database for FastAPI handlers and asyncio workers.
+
+    The underlying connection pool belongs to the event loop that first uses it,
+    so share one instance per loop.
+    """
+
+    def __init__(self):
+        self.rest = create_async_rest_client()
+
+    async def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
+        """Get user information by user ID"""
+        try:
+            response = await self.rest.from_('users').select(USER_COLUMNS).eq('id', user_id).execute()
+            if response.data:
+                return UserRecord.from_row(response.data[0])
+            return None
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {e}")
+            return None
+
+    async def get_new_messages(self, last_check_time: str) -> List[Dict[str, Any]]:
+        """Get new messages since last check"""
+        try:
+            response = await self.rest.from_('messages').select(MESSAGE_COLUMNS).gte('sent_at', last_check_time).execute()
+            logger.info("Found %d recent messages since %s", len(response.data), last_check_time)
+            return response.data
+        except Exception as e:
+            logger.error("Error getting new messages: %s", e)
+            return []
+
+    async def get_conversation_participants(self, conversation_id: str) -> List[UserRecord]:
+        """Get participants of a conversation, fetching guest and host concurrently"""
+        try:
+            response = await self.rest.from_('conversations').select('guest_id,host_id').eq('id', conversation_id).execute()
+            if not response.data:
+                return []
+            conversation = response.data[0]
+            user_ids = [conversation[key] for key in ('guest_id', 'host_id') if conversation.get(key)]
+            users = await asyncio.gather(*(self.get_user_by_id(user_id) for user_id in user_ids))
+            return [user for user in users if user]
+        except Exception as e:
+            logger.error(f"Error getting conversation participants: {e}")
+            return []
+
+    async def close(self):
+        """Release pooled connections"""
+        await self.rest.aclose()
+
+def create_database():
+    """Create the database backend selected by DATABASE_BACKEND"""
+    if config.DATABASE_BACKEND == "postgres":
+        from pg_database import PostgresDatabase
+        return PostgresDatabase()
+    return Database()
 
-db = Database() 
\ No newline at end of file
+db = create_database()
+async_db = AsyncDatabase() 
\ No newline at end of file
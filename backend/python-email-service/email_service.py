@@ -5,7 +5,15 @@ from sendgrid import SendGridAPIClient
 from sendgrid.helpers.mail import Mail
 from jinja2 import Environment, FileSystemLoader
 from config import config
-from typing import Dict, Any, Optional
+from profiling import phase_timings
+from shared_state import shared_state
+from suppression import suppression_list
+from routing import ProviderRouter
+from circuit_breaker import circuit_breakers
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, Optional, List, Tuple, Callable
+import time
 import logging
 
 logger = logging.getLogger(__name__)
@@ -23,32 +31,86 @@ class EmailService:
         )
         
         # Setup SendGrid if configured
-        if self.provider == "sendgrid" and config.SENDGRID_API_KEY:
+        if "sendgrid" in config.EMAIL_PROVIDERS and config.SENDGRID_API_KEY:
             self.sendgrid_client = SendGridAPIClient(api_key=config.SENDGRID_API_KEY)
+            self.sendgrid_client.client.timeout = config.SENDGRID_TIMEOUT
         else:
             self.sendgrid_client = None
+        
+        # Notification senders by event type, shared by the ingest queue and the scheduler
+        self.notification_senders: Dict[str, Callable[..., bool]] = {
+            'message': self.send_message_notification,
+            'listing_added': self.send_listing_added_notification,
+            'listing_edited': self.send_listing_edited_notification,
+            'listing_deleted': self.send_listing_deleted_notification,
+            'listing_expired': self.send_listing_expired_notification,
+        }
+        
+        # Emails recorded by the local sink provider
+        self.sink = deque(maxlen=1000)
+        
+        # Route sends between the configured providers by latency and error rate
+        senders = {
+            'smtp': self.send_smtp_email,
+            'sendgrid': self.send_sendgrid_email,
+            'sink': self.send_sink_email
+        }
+        providers = {
+            name: senders[name] for name in config.EMAIL_PROVIDERS
+            if name in senders and (name != 'sendgrid' or self.sendgrid_client)
+        }
+        if not providers:
+            logger.warning("No usable provider in EMAIL_PROVIDERS=%s, falling back to smtp", config.EMAIL_PROVIDERS)
+            providers = {'smtp': self.send_smtp_email}
+        self.router = ProviderRouter(
+            providers,
+            default_latency=config.ROUTING_DEFAULT_LATENCY,
+            error_penalty=config.ROUTING_ERROR_PENALTY,
+            error_half_life=config.ROUTING_ERROR_HALF_LIFE,
+            hedge=config.EMAIL_HEDGE_ENABLED,
+            hedge_min_samples=config.EMAIL_HEDGE_MIN_SAMPLES,
+            hedge_workers=config.EMAIL_HEDGE_WORKERS,
+            is_permanent=suppression_list.is_suppressed
+        )
+    
+    def build_mime_message(self, to_email: str, subject: str, html_content: str) -> MIMEMultipart:
+        """Build the MIME message sent over SMTP"""
+        msg = MIMEMultipart('alternative')
+        msg['Subject'] = subject
+        msg['From'] = f"{self.from_name} <{self.from_email}>"
+        msg['To'] = to_email
+        
+        html_part = MIMEText(html_content, 'html')
+        msg.attach(html_part)
+        return msg
+    
+    def is_suppressed(self, recipient_email: str) -> bool:
+        """Check the suppression list before doing any template work"""
+        if suppression_list.is_suppressed(recipient_email):
+            logger.info("Skipping suppressed recipient %s", recipient_email)
+            shared_state.incr('emails_suppressed')
+            return True
+        return False
     
     # Send email using SMTP
     def send_smtp_email(self, to_email: str, subject: str, html_content: str) -> bool:
         """Send email using SMTP"""
         try:
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = subject
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = to_email
-            
-            html_part = MIMEText(html_content, 'html')
-            msg.attach(html_part)
+            msg = self.build_mime_message(to_email, subject, html_content)
             
-            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT) as server:
+            with smtplib.SMTP(config.SMTP_HOST, config.SMTP_PORT, timeout=config.SMTP_TIMEOUT) as server:
                 server.starttls()
                 server.login(config.SMTP_USER, config.SMTP_PASSWORD)
                 server.send_message(msg)
             
-            logger.info(f"SMTP email sent to {to_email}")
+            logger.info("SMTP email sent to %s", to_email)
             return True
+        except smtplib.SMTPRecipientsRefused as e:
+            logger.error("SMTP email refused for %s: %s", to_email, e.recipients)
+            suppression_list.record_smtp_refusals(e.recipients)
+            return False
         except Exception as e:
-            logger.error(f"SMTP email failed to {to_email}: {e}")
+            logger.error("SMTP email failed to %s: %s", to_email, e)
             return False
     
     def send_sendgrid_email(self, to_email: str, subject: str, html_content: str) -> bool:
@@ -62,31 +124,128 @@ class EmailService:
             )
             
             response = self.sendgrid_client.send(message)
-            logger.info(f"SendGrid email sent to {to_email}, status: {response.status_code}")
+            logger.info("SendGrid email sent to %s, status: %s", to_email, response.status_code)
             return True
         except Exception as e:
-            logger.error(f"SendGrid email failed to {to_email}: {e}")
+            logger.error("SendGrid email failed to %s: %s", to_email, e)
             return False
     
+    def send_sink_email(self, to_email: str, subject: str, html_content: str) -> bool:
+        """Record the email locally instead of sending it (tests and local runs)"""
+        self.sink.append({
+            'to_email': to_email,
+            'subject': subject,
+            'size': len(html_content),
+            'sent_at': datetime.utcnow().isoformat()
+        })
+        logger.info("Sink email recorded for %s", to_email)
+        return True
+    
     def send_email(self, to_email: str, subject: str, html_content: str) -> bool:
-        """Send email using configured provider"""
-        if self.provider == "sendgrid" and self.sendgrid_client:
-            return self.send_sendgrid_email(to_email, subject, html_content)
-        else:
-            return self.send_smtp_email(to_email, subject, html_content)
+        """Send email through the healthiest configured provider, failing over on errors"""
+        with phase_timings.span('send'):
+            success = self.router.send(to_email, subject, html_content)
+        shared_state.incr('emails_sent' if success else 'emails_failed')
+        return success
+    
+    def send_smtp_batch(self, emails: List[Tuple[str, str, str]]) -> List[bool]:
+        """Send (to_email, subject, html_content) tuples over one SMTP session"""
+        results = []
+        server = None
+        try:
+            for to_email, subject, html_content in emails:
+                if server is None:
+                    connection = smtplib.SMTP(timeout=config.SMTP_TIMEOUT)
+                    try:
+                        connection.connect(config.SMTP_HOST, config.SMTP_PORT)
+                        connection.starttls()
+                        connection.login(config.SMTP_USER, config.SMTP_PASSWORD)
+                        server = connection
+                    except Exception as e:
+                        # Don't wait out a connect timeout for every remaining message
+                        logger.error("SMTP connection failed, skipping %d emails: %s", len(emails) - len(results), e)
+                        connection.close()
+                        results.extend([False] * (len(emails) - len(results)))
+                        break
+                try:
+                    server.send_message(self.build_mime_message(to_email, subject, html_content))
+                    results.append(True)
+                except smtplib.SMTPRecipientsRefused as e:
+                    logger.error("SMTP email refused for %s: %s", to_email, e.recipients)
+                    suppression_list.record_smtp_refusals(e.recipients)
+                    results.append(False)
+                except smtplib.SMTPServerDisconnected as e:
+                    # Reconnect for the next message
+                    logger.error("SMTP email failed to %s: %s", to_email, e)
+                    server = None
+                    results.append(False)
+                except Exception as e:
+                    logger.error("SMTP email failed to %s: %s", to_email, e)
+                    results.append(False)
+        finally:
+            if server is not None:
+                try:
+                    server.quit()
+                except Exception:
+                    pass
+        logger.info("SMTP batch sent %d/%d emails", sum(results), len(emails))
+        return results
+    
+    def send_batch(self, emails: List[Tuple[str, str, str]]) -> List[bool]:
+        """Send several emails, over one SMTP session when SMTP is the preferred provider"""
+        with phase_timings.span('send'):
+            # allow() reserves a half-open trial slot, so a recovering breaker admits one batch, not many
+            if self.router.ranked()[:1] == ['smtp'] and circuit_breakers.get('smtp').allow():
+                start = time.perf_counter()
+                results = self.send_smtp_batch(emails)
+                per_email = (time.perf_counter() - start) / max(len(emails), 1)
+                for i, (ok, email) in enumerate(zip(results, emails)):
+                    if ok:
+                        self.router.record('smtp', per_email, True)
+                    elif not suppression_list.is_suppressed(email[0]):
+                        self.router.record('smtp', per_email, False)
+                        # Resend what the shared session could not deliver on another provider; retrying
+                        # SMTP here would open a new connection per message, each waiting up to SMTP_TIMEOUT
+                        results[i] = self.router.send(*email, exclude=('smtp',))
+            else:
+                results = [self.router.send(*email) for email in emails]
+        shared_state.incr('emails_sent', sum(results))
+        shared_state.incr('emails_failed', len(results) - sum(results))
+        return results
     
     def render_template(self, template_name: str, context: Dict[str, Any]) -> str:
         """Render HTML email template"""
         try:
-            template = self.template_env.get_template(template_name)
-            return template.render(**context)
+            with phase_timings.span('render'):
+                template = self.template_env.get_template(template_name)
+                return template.render(**context)
         except Exception as e:
             logger.error(f"Template rendering failed for {template_name}: {e}")
             return ""
     
+    def render_many(self, template_name: str, contexts: List[Dict[str, Any]]) -> List[str]:
+        """Render one template for many contexts, loading it only once"""
+        try:
+            template = self.template_env.get_template(template_name)
+        except Exception as e:
+            logger.error(f"Template loading failed for {template_name}: {e}")
+            return ["" for _ in contexts]
+        rendered = []
+        with phase_timings.span('render'):
+            for context in contexts:
+                try:
+                    rendered.append(template.render(**context))
+                except Exception as e:
+                    logger.error(f"Template rendering failed for {template_name}: {e}")
+                    rendered.append("")
+        return rendered
+    
     # Connects to the message_notification.html template with the context
     def send_message_notification(self, recipient_email: str, sender_name: str, message_preview: str, conversation_url: str) -> bool:
         """Send a new message notification email"""
+        if self.is_suppressed(recipient_email):
+            return False
+        
         subject = f"New message from {sender_name} on Subly"
         
         context = {
@@ -104,6 +263,9 @@ class EmailService:
 
     def send_listing_added_notification(self, recipient_email: str, host_name: str, listing_title: str, listing_address: str, listing_price: str, start_date: str, end_date: str, listing_url: str) -> bool:
         """Send a listing added notification email"""
+        if self.is_suppressed(recipient_email):
+            return False
+        
         subject = f"Your listing '{listing_title}' has been added to Subly"
         
         context = {
@@ -125,6 +287,9 @@ class EmailService:
 
     def send_listing_edited_notification(self, recipient_email: str, host_name: str, listing_title: str, listing_address: str, listing_price: str, start_date: str, end_date: str, listing_url: str) -> bool:
         """Send a listing edited notification email"""
+        if self.is_suppressed(recipient_email):
+            return False
+        
         subject = f"Your listing '{listing_title}' has been updated on Subly"
         
         context = {
@@ -146,6 +311,9 @@ class EmailService:
 
     def send_listing_deleted_notification(self, recipient_email: str, host_name: str, listing_title: str, listing_address: str, listing_price: str, removal_date: str, dashboard_url: str) -> bool:
         """Send a listing deleted notification email"""
+        if self.is_suppressed(recipient_email):
+            return False
+        
         subject = f"Your listing '{listing_title}' has been removed from Subly"
         
         context = {
@@ -166,6 +334,9 @@ class EmailService:
 
     def send_listing_expired_notification(self, recipient_email: str, host_name: str, listing_title: str, listing_address: str, listing_price: str, end_date: str, expiration_date: str, dashboard_url: str) -> bool:
         """Send a listing expired notification email"""
+        if self.is_suppressed(recipient_email):
+            return False
+        
         subject = f"Your listing '{listing_title}' has expired on Subly"
         
         context = {
@@ -185,4 +356,51 @@ class EmailService:
             return self.send_email(recipient_email, subject, html_content)
         return False
 
+    def send_listing_expired_notifications(self, listings: List[Dict[str, Any]], batch_size: int = 100, on_progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+        """Send listing expired emails in batches, one render pass and SMTP session per batch.
+
+        Each listing dict carries the send_listing_expired_notification arguments.
+        Suppressed recipients are dropped before rendering and not counted as failures.
+        `results` holds one entry per listing: True if sent, False if failed, None if suppressed.
+        """
+        sent = failed = 0
+        results: List[Optional[bool]] = [None] * len(listings)
+        suppressed = suppression_list.filter([listing['recipient_email'] for listing in listings])
+        if any(suppressed):
+            shared_state.incr('emails_suppressed', sum(suppressed))
+            logger.info("Skipping %d suppressed recipients", sum(suppressed))
+        indexes = [i for i, skip in enumerate(suppressed) if not skip]
+        for start in range(0, len(indexes), batch_size):
+            batch = [listings[i] for i in indexes[start:start + batch_size]]
+            contexts = [{
+                'host_name': listing['host_name'],
+                'listing_title': listing['listing_title'],
+                'listing_address': listing['listing_address'],
+                'listing_price': listing['listing_price'],
+                'end_date': listing['end_date'],
+                'expiration_date': listing['expiration_date'],
+                'dashboard_url': listing['dashboard_url'],
+                'app_name': 'Subly'
+            } for listing in batch]
+            
+            emails, email_indexes = [], []
+            for i, listing, html_content in zip(indexes[start:start + batch_size], batch, self.render_many('listing_expired.html', contexts)):
+                if html_content:
+                    subject = f"Your listing '{listing['listing_title']}' has expired on Subly"
+                    emails.append((listing['recipient_email'], subject, html_content))
+                    email_indexes.append(i)
+                else:
+                    failed += 1
+                    results[i] = False
+            
+            batch_results = self.send_batch(emails)
+            for i, ok in zip(email_indexes, batch_results):
+                results[i] = ok
+            sent += sum(batch_results)
+            failed += len(batch_results) - sum(batch_results)
+            if on_progress:
+                on_progress(sent, failed)
+        
+        return {'sent': sent, 'failed': failed, 'results': results}
+
 email_service = EmailService() 
\ No newline at end of file
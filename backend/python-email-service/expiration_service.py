@@ -0,0 +1,114 @@
+from database import db
+from email_service import email_service
+from config import config
+from scheduler import delivery_scheduler
+from shared_state import shared_state
+from datetime import datetime
+from typing import Dict, Any, List
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ExpirationService:
+    """Expires listings past their end date and emails their hosts in bulk"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.progress: Dict[str, Any] = {
+            'status': 'idle',
+            'expired': 0,
+            'missing_host': 0,
+            'sent': 0,
+            'failed': 0,
+            'started_at': None,
+            'finished_at': None
+        }
+
+    def _set_progress(self, **fields):
+        # Published so every API process can answer /expire-listings/status, not just the one running the sweep
+        self.progress.update(**fields)
+        shared_state.publish('expiration_progress', self.progress)
+
+    def status(self) -> Dict[str, Any]:
+        """Progress of the current or last sweep, whichever process ran it"""
+        return shared_state.published('expiration_progress').get('expiration_progress') or dict(self.progress)
+
+    def _update_progress(self, sent: int, failed: int):
+        self._set_progress(sent=sent, failed=failed)
+        logger.info("Expiration emails: %d/%d processed (%d failed)", sent + failed, self.progress['expired'], failed)
+
+    def build_notification(self, listing: Dict[str, Any], expiration_date: str) -> Dict[str, Any]:
+        """Map a joined listing/host row onto the listing_expired.html arguments"""
+        address_parts = [listing.get('address'), listing.get('city'), listing.get('state')]
+        return {
+            'recipient_email': listing['host_email'],
+            'host_name': listing.get('host_name') or '',
+            'listing_title': listing.get('title') or '',
+            'listing_address': ', '.join(part for part in address_parts if part),
+            'listing_price': str(listing.get('price_per_night') or ''),
+            'end_date': str(listing.get('end_date') or ''),
+            'expiration_date': expiration_date,
+            'dashboard_url': f"{config.FRONTEND_URL}/my-listings"
+        }
+
+    def schedule_notifications(self, notifications: List[Dict[str, Any]]):
+        """Hand notifications to the delivery scheduler in batches spaced evenly over EXPIRATION_SPREAD_MINUTES"""
+        batch_size = config.EXPIRATION_BATCH_SIZE
+        batches = (len(notifications) + batch_size - 1) // batch_size
+        interval = config.EXPIRATION_SPREAD_MINUTES * 60 / batches
+        now = time.time()
+        delivery_scheduler.schedule_many([
+            ('listing_expired', notification, now + (i // batch_size) * interval, None)
+            for i, notification in enumerate(notifications)
+        ])
+        logger.info("Scheduled %d expiration emails in %d batches over %s minutes", len(notifications), batches, config.EXPIRATION_SPREAD_MINUTES)
+
+    def start(self) -> Dict[str, Any]:
+        """Start a sweep in a background thread and return at once; poll `status()` for the outcome"""
+        if not self._lock.acquire(blocking=False):
+            logger.info("Expiration sweep already running, skipping")
+            return dict(self.progress)
+        self._reset_progress()
+        threading.Thread(target=self._sweep, name='expiration-sweep', daemon=True).start()
+        return dict(self.progress)
+
+    def _reset_progress(self):
+        self._set_progress(
+            status='running', expired=0, missing_host=0, sent=0, failed=0,
+            started_at=datetime.now().isoformat(), finished_at=None
+        )
+
+    def _sweep(self):
+        """Bulk-expire listings, then send all notifications in batches; runs with the lock held and releases it"""
+        try:
+            expired = db.expire_listings()
+            self._set_progress(expired=len(expired))
+            logger.info("Expired %d listings", len(expired))
+
+            expiration_date = datetime.now().strftime('%Y-%m-%d')
+            notifications = [
+                self.build_notification(listing, expiration_date)
+                for listing in expired if listing.get('host_email')
+            ]
+            self._set_progress(missing_host=len(expired) - len(notifications))
+            if self.progress['missing_host']:
+                logger.error("%d expired listings have no host email and will not be notified", self.progress['missing_host'])
+            if config.EXPIRATION_SPREAD_MINUTES > 0 and notifications:
+                self.schedule_notifications(notifications)
+                self._set_progress(status='scheduled', finished_at=datetime.now().isoformat())
+            else:
+                email_service.send_listing_expired_notifications(
+                    notifications,
+                    batch_size=config.EXPIRATION_BATCH_SIZE,
+                    on_progress=self._update_progress
+                )
+                self._set_progress(status='completed', finished_at=datetime.now().isoformat())
+        except Exception as e:
+            logger.error(f"Error running expiration sweep: {e}")
+            self._set_progress(status='failed', finished_at=datetime.now().isoformat())
+        finally:
+            self._lock.release()
+
+expiration_service = ExpirationService()
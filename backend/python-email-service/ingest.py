@@ -0,0 +1,134 @@
+from email_service import email_service
+from config import config
+from shared_state import shared_state
+from pydantic import BaseModel, ValidationError
+from starlette.responses import StreamingResponse
+from typing import AsyncIterator, Callable, Dict, Any
+from functools import partial
+import asyncio
+import json
+import queue
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+class NotificationQueue:
+    """Bounded in-process queue drained by sender threads"""
+
+    def __init__(self, maxsize: int, workers: int):
+        self.queue: queue.Queue = queue.Queue(maxsize=maxsize)
+        self.workers = workers
+        self.threads = []
+        self.senders: Dict[str, Callable[..., bool]] = email_service.notification_senders
+
+    def start(self):
+        """Start sender threads on first use"""
+        if self.threads:
+            return
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"ingest-sender-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def _run(self):
+        while True:
+            event_type, payload = self.queue.get()
+            try:
+                if self.senders[event_type](**payload):
+                    shared_state.incr('ingest_sent')
+                else:
+                    shared_state.incr('ingest_failed')
+            except Exception as e:
+                logger.error(f"Error sending {event_type} notification: {e}")
+                shared_state.incr('ingest_failed')
+            finally:
+                self.queue.task_done()
+
+    async def put(self, event_type: str, payload: Dict[str, Any]):
+        """Enqueue an event, waiting off the event loop while the queue is full"""
+        self.start()
+        item = (event_type, payload)
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, partial(self.queue.put, item, timeout=config.INGEST_ENQUEUE_TIMEOUT))
+        shared_state.incr('ingest_queued')
+
+class DuplexStreamingResponse(StreamingResponse):
+    """StreamingResponse whose body iterator is still reading the request.
+
+    The stock response listens on `receive` for disconnects, which would consume
+    request body chunks; here the iterator owns `receive` and sees disconnects itself.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+def _result(**fields) -> bytes:
+    return (json.dumps(fields, default=str) + "\n").encode()
+
+async def ingest_ndjson(chunks: AsyncIterator[bytes], parse: Callable[[bytes], BaseModel], notification_queue: NotificationQueue) -> AsyncIterator[bytes]:
+    """Validate and enqueue NDJSON events as they arrive, yielding one result line per input line"""
+    max_line = config.INGEST_MAX_LINE_BYTES
+    buffer = b""
+    line_no = 0
+    skipping = False
+    counts = {'queued': 0, 'invalid': 0, 'rejected': 0}
+
+    async def handle(line: bytes):
+        nonlocal line_no
+        line_no += 1
+        if not line.strip():
+            return None
+        if len(line) > max_line:
+            counts['invalid'] += 1
+            return _result(line=line_no, status='invalid', error=f"line exceeds {max_line} bytes")
+        try:
+            event = parse(line)
+        except ValidationError as e:
+            counts['invalid'] += 1
+            return _result(line=line_no, status='invalid', errors=e.errors(include_url=False, include_input=False))
+        try:
+            await notification_queue.put(event.type, event.model_dump(exclude={'type'}))
+        except queue.Full:
+            counts['rejected'] += 1
+            return _result(line=line_no, status='rejected', error='queue full')
+        counts['queued'] += 1
+        return _result(line=line_no, status='queued', type=event.type)
+
+    async for chunk in chunks:
+        buffer += chunk
+        # Scan from an offset and trim once per chunk, so splitting stays linear in the chunk size
+        start = 0
+        while (newline := buffer.find(b"\n", start)) != -1:
+            line, start = buffer[start:newline], newline + 1
+            if skipping:
+                # Tail of an oversized line
+                skipping = False
+                continue
+            result = await handle(line)
+            if result:
+                yield result
+        buffer = buffer[start:]
+        if skipping:
+            buffer = b""
+        elif len(buffer) > max_line:
+            line_no += 1
+            counts['invalid'] += 1
+            yield _result(line=line_no, status='invalid', error=f"line exceeds {max_line} bytes")
+            buffer = b""
+            skipping = True
+
+    if buffer and not skipping:
+        result = await handle(buffer)
+        if result:
+            yield result
+
+    logger.info("NDJSON ingest finished: %d queued, %d invalid, %d rejected", counts['queued'], counts['invalid'], counts['rejected'])
+    yield _result(status='done', lines=line_no, **counts)
+
+notification_queue = NotificationQueue(maxsize=config.INGEST_QUEUE_SIZE, workers=config.INGEST_WORKERS)
@@ -0,0 +1,117 @@
+from logging.handlers import QueueHandler, QueueListener
+from config import config
+from datetime import datetime, timezone
+from typing import Tuple
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+
+PLAIN_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; tracebacks go in an `exception` field"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'process': record.process,
+            'thread': record.threadName,
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            entry['suppressed'] = suppressed
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `rate` INFO-and-below records per second through for each message template.
+
+    Templates are keyed on the unformatted `record.msg`, so callers should log with
+    %-style arguments. Dropped records are counted on the next one that passes.
+    At most `max_buckets` templates are tracked; idle ones are evicted first.
+    Records from loggers in `exempt` (and their children) are never limited.
+    """
+
+    def __init__(self, rate: float, max_buckets: int = 1000, idle_seconds: float = 60, exempt: Tuple[str, ...] = ()):
+        super().__init__()
+        self.rate = rate
+        self.exempt = exempt
+        self.max_buckets = max_buckets
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self.buckets = {}
+
+    def _evict(self, now: float):
+        """Make room for a new bucket, dropping idle ones and then the least recently used"""
+        self.buckets = {key: bucket for key, bucket in self.buckets.items() if now - bucket[1] < self.idle_seconds}
+        while len(self.buckets) >= self.max_buckets:
+            del self.buckets[min(self.buckets, key=lambda key: self.buckets[key][1])]
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or self.rate <= 0:
+            return True
+        if any(record.name == name or record.name.startswith(name + '.') for name in self.exempt):
+            return True
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        with self._lock:
+            if key not in self.buckets and len(self.buckets) >= self.max_buckets:
+                self._evict(now)
+            tokens, last, dropped = self.buckets.get(key, (self.rate, now, 0))
+            tokens = min(self.rate, tokens + (now - last) * self.rate)
+            if tokens < 1:
+                self.buckets[key] = (tokens, now, dropped + 1)
+                return False
+            self.buckets[key] = (tokens - 1, now, 0)
+        record.suppressed = dropped
+        return True
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Keep the record lazy; the listener thread does the formatting
+        return record
+
+_listener = None
+
+def configure_logging():
+    """Configure root logging according to LOG_MODE (plain or async)"""
+    global _listener
+    if config.LOG_MODE != "async":
+        logging.basicConfig(level=config.LOG_LEVEL, format=PLAIN_FORMAT)
+        return
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler()
+    output.setFormatter(JsonFormatter())
+
+    queue_handler = DroppingQueueHandler(queue.Queue(maxsize=config.LOG_QUEUE_SIZE))
+    # Access logs share one template, so limiting them would cap the log at LOG_INFO_RATE requests per second
+    queue_handler.addFilter(RateLimitFilter(config.LOG_INFO_RATE, exempt=('uvicorn.access',)))
+
+    root = logging.getLogger()
+    root.handlers = [queue_handler]
+    root.setLevel(config.LOG_LEVEL)
+
+    _listener = QueueListener(queue_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
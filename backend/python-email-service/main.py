@@ -1,16 +1,16 @@
 import asyncio
 import threading
+import multiprocessing
+import time
 import logging
 from api import app
 from notification_worker import notification_worker
 from config import config
+from logging_setup import configure_logging
 import uvicorn
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -20,26 +20,45 @@ def start_worker():
         logger.info("Starting notification worker...")
         # Import and start the notification worker
         from notification_worker import notification_worker
+        from process_snapshots import process_snapshots
+        from suppression import suppression_list
+        suppression_list.start()
+        notification_worker.start()
+        # Lets API processes report this process's breakers, provider stats and phase timings
+        process_snapshots.start('worker')
         
         # The worker has its own scheduler that runs every 2 minutes
         # Just keep this thread alive
         while True:
-            import time
             time.sleep(60)
     except KeyboardInterrupt:
         logger.info("Stopping notification worker...")
 
-def start_api():
+def supervise_worker():
+    """Keep exactly one notification worker process running, restarting it if it dies"""
+    context = multiprocessing.get_context("spawn")
+    while True:
+        process = context.Process(target=start_worker, name="notification-worker", daemon=True)
+        process.start()
+        logger.info("Notification worker process started (pid %s)", process.pid)
+        process.join()
+        logger.error(f"Notification worker process exited with code {process.exitcode}, restarting in 5s")
+        time.sleep(5)
+
+def start_api(workers: int = 1):
     """Start the FastAPI server"""
     try:
-        logger.info(f"Starting API server on {config.HOST}:{config.PORT}")
+        logger.info("Starting API server on %s:%s with %d worker(s)", config.HOST, config.PORT, workers)
         uvicorn.run( # Server for the API
             "api:app",
             host=config.HOST,
             port=config.PORT,
             reload=False,  # Disable reload in production
+            workers=workers,
             log_level="info",
-            access_log=True
+            access_log=True,
+            # In async mode uvicorn's records go through the root queue handler instead of its own stream handlers
+            log_config=None if config.LOG_MODE == "async" else uvicorn.config.LOGGING_CONFIG
         )
     except Exception as e:
         logger.error(f"Error starting API server: {e}")
@@ -49,6 +68,14 @@ def main():
     """Main function to start both API and worker"""
     logger.info("Starting Subly Email Service...")
     
+    if config.SERVING_MODE == "multiprocess":
+        if config.SHARED_STATE_BACKEND != "redis":
+            logger.warning("SHARED_STATE_BACKEND is not redis; dedup and metrics will not be shared between processes")
+        # One supervised worker process, N pre-forked API processes
+        threading.Thread(target=supervise_worker, daemon=True).start()
+        start_api(workers=config.API_WORKERS)
+        return
+    
     # Start the notification worker in a separate thread
     worker_thread = threading.Thread(target=start_worker, daemon=True)
     worker_thread.start()
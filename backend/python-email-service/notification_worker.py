@@ -4,9 +4,12 @@ from apscheduler.triggers.interval import IntervalTrigger
 from database import db
 from email_service import email_service
 from config import config
+from profiling import phase_timings
+from records import MessageNotification
+from shared_state import shared_state
+from scheduler import delivery_scheduler
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, Any, List
 import time
 import os
 
@@ -22,8 +25,11 @@ scheduler = BackgroundScheduler()
 class NotificationWorker:
     def __init__(self):
         self.last_check_time = datetime.now().isoformat()
-        self.processed_messages = set()  # Track processed messages in memory
+    
+    def start(self):
+        """Start polling and delayed delivery; call from exactly one process"""
         self.setup_scheduler()
+        delivery_scheduler.start()
     
     def setup_scheduler(self):
         """Setup the scheduler to check for new messages every 2 minutes"""
@@ -40,119 +46,99 @@ class NotificationWorker:
     def check_new_messages(self):
         """Check for new messages and send notifications"""
         try:
-            logger.info(f"🔍 Checking for new messages since {self.last_check_time}")
-            
-            # Clear processed messages periodically to prevent memory leaks
-            if len(self.processed_messages) > 1000:
-                logger.info("🧹 Clearing processed messages cache to prevent memory leak")
-                self.processed_messages.clear()
+            logger.info("🔍 Checking for new messages since %s", self.last_check_time)
             
-            # Get new messages from database
-            new_messages = db.get_new_messages(self.last_check_time)
+            # Get new messages; already processed ones are skipped before any sender/recipient lookup
+            with phase_timings.span('poll'):
+                row_count, new_messages = db.get_new_message_notifications(self.last_check_time, shared_state.is_processed)
             
-            if not new_messages:
+            if not row_count:
                 logger.info("✅ No new messages found to process")
                 return
             
-            logger.info(f"📧 Found {len(new_messages)} new messages to process")
-            
-            # Process each new message (filter out already processed ones)
-            unprocessed_messages = [msg for msg in new_messages if msg.get('id') not in self.processed_messages]
-            logger.info(f"📤 {len(unprocessed_messages)} unprocessed messages out of {len(new_messages)} total")
+            # Stream over the records
+            processed = 0
+            with phase_timings.span('process'):
+                for message in new_messages:
+                    processed += 1
+                    logger.info("📤 Processing message %s from conversation %s", message.id, message.conversation_id)
+                    self.process_message(message)
             
-            for message in unprocessed_messages:
-                logger.info(f"📤 Processing message {message.get('id')} from conversation {message.get('conversation_id')}")
-                self.process_message(message)
+            logger.info("📧 Processed %d of %d new messages (rest already processed or unresolvable)", processed, row_count)
             
             # Update last check time
             self.last_check_time = datetime.now().isoformat()
-            logger.info(f"✅ Finished processing messages. Next check after {self.last_check_time}")
+            logger.info("✅ Finished processing messages. Next check after %s", self.last_check_time)
             
         except Exception as e:
-            logger.error(f"❌ Error checking new messages: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Error checking new messages: %s", e)
     
-    def process_message(self, message: Dict[str, Any]):
-        """Process a single message and send notification"""
+    def process_message(self, message: MessageNotification):
+        """Process a single message (joined with sender and recipient) and send notification"""
         try:
-            message_id = message.get('id')
-            sender_id = message.get('sender_id')
-            conversation_id = message.get('conversation_id')
-            content = message.get('body', '')  # Using 'body' field instead of 'content'
+            message_id = message.id
             
-            # Check if we already processed this message in this session
-            if message_id in self.processed_messages:
-                logger.info(f"Message {message_id} already processed in this session, skipping")
-                return
-            
-            # Get sender information
-            sender = db.get_user_by_id(sender_id)
-            if not sender:
-                logger.error(f"Sender {sender_id} not found for message {message_id}")
-                return
-            
-            # Get conversation participants
-            participants = db.get_conversation_participants(conversation_id)
-            if not participants:
-                logger.error(f"No participants found for conversation {conversation_id}")
-                return
-            
-            # Find recipient (the other person in the conversation)
-            recipient = None
-            for participant in participants:
-                if participant.get('id') != sender_id:
-                    recipient = participant
-                    break
-            
-            if not recipient:
-                logger.error(f"No recipient found for message {message_id}")
+            # Check if we already processed this message (shared across processes)
+            if shared_state.is_processed(message_id):
+                logger.info("Message %s already processed, skipping", message_id)
                 return
             
             # Send email notification
-            self.send_notification(message, sender, recipient, conversation_id)
+            self.send_notification(message)
             
-            # Mark message as processed in memory and log it
-            self.processed_messages.add(message_id)
+            # Mark message as processed and log it
+            shared_state.mark_processed(message_id)
             db.mark_message_notified(message_id)
             
         except Exception as e:
-            logger.error(f"Error processing message {message.get('id')}: {e}")
+            logger.error("Error processing message %s: %s", message.id, e)
     
-    def send_notification(self, message: Dict[str, Any], sender: Dict[str, Any], recipient: Dict[str, Any], conversation_id: str):
+    def send_notification(self, message: MessageNotification):
         """Send email notification for a new message"""
         try:
-            recipient_email = recipient.get('email')
+            recipient_email = message.recipient_email
             if not recipient_email:
-                logger.error(f"No email found for recipient {recipient.get('id')}")
+                logger.error("No email found for recipient %s", message.recipient_id)
                 return
 
-            sender_name = sender.get('name', sender.get('first_name', 'Someone'))
-            message_preview = message.get('body', '')[:100] + ('...' if len(message.get('body', '')) > 100 else '')
+            sender_name = message.sender_name or 'Someone'
 
             # Create conversation URL using frontend URL from config
-            conversation_url = f"{config.FRONTEND_URL}/messages?conversation={conversation_id}"
+            conversation_url = f"{config.FRONTEND_URL}/messages?conversation={message.conversation_id}"
 
-            # Extract recipient first name from full name
-            recipient_full_name = recipient.get('full_name', '')
-            recipient_first_name = recipient_full_name.split()[0] if recipient_full_name else ''
+            if config.MESSAGE_NOTIFICATION_DELAY_MINUTES > 0:
+                # Only email if the recipient hasn't read the message by then
+                delivery_scheduler.schedule(
+                    'message',
+                    {
+                        'recipient_email': recipient_email,
+                        'sender_name': sender_name,
+                        'message_preview': message.preview,
+                        'conversation_url': conversation_url
+                    },
+                    time.time() + config.MESSAGE_NOTIFICATION_DELAY_MINUTES * 60,
+                    {'unread_message_id': message.id}
+                )
+                shared_state.incr('messages_scheduled')
+                return
 
             # Send email
             success = email_service.send_message_notification(
                 recipient_email=recipient_email,
-                recipient_first_name=recipient_first_name,
                 sender_name=sender_name,
-                message_preview=message_preview,
+                message_preview=message.preview,
                 conversation_url=conversation_url
             )
             
             if success:
-                logger.info(f"Email notification sent to {recipient_email} for message {message.get('id')}")
+                shared_state.incr('messages_notified')
+                logger.info("Email notification sent to %s for message %s", recipient_email, message.id)
             else:
-                logger.error(f"Failed to send email notification to {recipient_email}")
+                shared_state.incr('messages_failed')
+                logger.error("Failed to send email notification to %s", recipient_email)
                 
         except Exception as e:
-            logger.error(f"Error sending notification: {e}")
+            logger.error("Error sending notification: %s", e)
 
 # Celery task for manual triggering
 @celery_app.task
@@ -161,7 +147,7 @@ def send_message_notification_task(message_id: str):
     try:
         # Get message from database
         # This would need to be implemented based on your database structure
-        logger.info(f"Processing message notification for {message_id}")
+        logger.info("Processing message notification for %s", message_id)
         # Implementation would go here
     except Exception as e:
         logger.error(f"Error in notification task: {e}")
@@ -172,6 +158,7 @@ notification_worker = NotificationWorker()
 if __name__ == "__main__":
     try:
         logger.info("Starting notification worker...")
+        notification_worker.start()
         # Keep the worker running
         while True:
             time.sleep(60)
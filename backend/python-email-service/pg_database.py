@@ -0,0 +1,216 @@
+from psycopg import OperationalError
+from psycopg.rows import dict_row, class_row
+from psycopg_pool import ConnectionPool
+from circuit_breaker import circuit_breakers
+from config import config
+from contextlib import contextmanager
+from records import UserRecord, MessageNotification
+from typing import List, Dict, Any, Optional, Set, Callable, Tuple, Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+# One round trip: each new message with its sender and the other participant,
+# with the body already cut down to the email preview. Outer joins keep messages
+# whose sender or recipient no longer resolves, so row_count is the raw row count.
+NEW_MESSAGE_NOTIFICATIONS_QUERY = """
+    SELECT m.id::text AS id,
+           m.conversation_id::text AS conversation_id,
+           m.sender_id::text AS sender_id,
+           s.id IS NOT NULL AS sender_found,
+           s.name AS sender_name,
+           r.id::text AS recipient_id,
+           r.email AS recipient_email,
+           left(m.body, %(preview_length)s)
+               || CASE WHEN length(m.body) > %(preview_length)s THEN '...' ELSE '' END AS preview,
+           count(*) OVER () AS row_count
+    FROM public.messages m
+    LEFT JOIN public.conversations c ON c.id = m.conversation_id
+    LEFT JOIN public.users s ON s.id = m.sender_id
+    LEFT JOIN public.users r ON r.id = CASE WHEN m.sender_id = c.guest_id THEN c.host_id ELSE c.guest_id END
+    WHERE m.sent_at >= %(since)s
+    ORDER BY m.sent_at, m.id
+"""
+
+# Mark newly expired listings inactive and return them with their hosts in one statement;
+# listings whose host row is missing come back with a NULL host_email
+EXPIRE_LISTINGS_QUERY = """
+    WITH expired AS (
+        UPDATE public.listings
+        SET status = 'inactive'
+        WHERE (status IS NULL OR status IN ('active', 'approved'))
+          AND end_date < CURRENT_TIMESTAMP
+        RETURNING id, user_id, title, address, city, state, price_per_night, end_date
+    )
+    SELECT e.*, u.name AS host_name, u.email AS host_email
+    FROM expired e
+    LEFT JOIN public.users u ON u.id = e.user_id
+"""
+
+class PostgresDatabase:
+    """Database backend that queries Postgres directly through a connection pool"""
+
+    def __init__(self):
+        self.pool = ConnectionPool(
+            config.DATABASE_URL,
+            min_size=config.DATABASE_POOL_MIN,
+            max_size=config.DATABASE_POOL_MAX,
+            timeout=config.DATABASE_CONNECT_TIMEOUT,
+            kwargs={
+                'row_factory': dict_row,
+                'autocommit': True,
+                'connect_timeout': config.DATABASE_CONNECT_TIMEOUT,
+                'options': f"-c statement_timeout={int(config.DATABASE_STATEMENT_TIMEOUT * 1000)}"
+            },
+            open=True
+        )
+        circuit_breakers.get('postgres')
+
+    @contextmanager
+    def connection(self):
+        """Borrow a pooled connection, failing fast while the Postgres breaker is open"""
+        breaker = circuit_breakers.get('postgres')
+        breaker.check()
+        try:
+            with self.pool.connection() as conn:
+                yield conn
+        except OperationalError:
+            # Connection loss, pool timeouts and statement timeouts
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+
+    def get_user_by_id(self, user_id: str) -> Optional[UserRecord]:
+        """Get user information by user ID"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor(row_factory=class_row(UserRecord))
+                return cursor.execute(
+                    'SELECT id::text AS id, name, email FROM public.users WHERE id = %s', (user_id,)
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Error getting user {user_id}: {e}")
+            return None
+
+    def get_new_messages(self, last_check_time: str) -> List[Dict[str, Any]]:
+        """Get new messages since last check"""
+        try:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    'SELECT id, conversation_id, sender_id, body FROM public.messages WHERE sent_at >= %s ORDER BY sent_at, id',
+                    (last_check_time,)
+                ).fetchall()
+            logger.info("Found %d recent messages since %s", len(rows), last_check_time)
+            return rows
+        except Exception as e:
+            logger.error("Error getting new messages: %s", e)
+            return []
+
+    def get_new_message_notifications(self, last_check_time: str, is_processed: Optional[Callable[[str], bool]] = None) -> Tuple[int, Iterator[MessageNotification]]:
+        """Get the number of new message rows and their notifications, joined with sender and recipient in one query.
+
+        The count includes messages whose sender or recipient no longer resolves;
+        those, and messages for which `is_processed` is true, are skipped as records are consumed.
+        """
+        try:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    NEW_MESSAGE_NOTIFICATIONS_QUERY,
+                    {'since': last_check_time, 'preview_length': config.MESSAGE_PREVIEW_LENGTH}
+                ).fetchall()
+        except Exception as e:
+            logger.error("Error getting new message notifications: %s", e)
+            return 0, iter(())
+        row_count = rows[0]['row_count'] if rows else 0
+        logger.info("Found %d recent messages since %s", row_count, last_check_time)
+        return row_count, self._to_notifications(rows, is_processed)
+
+    def _to_notifications(self, rows: List[Dict[str, Any]], is_processed: Optional[Callable[[str], bool]]) -> Iterator[MessageNotification]:
+        for row in rows:
+            if is_processed and is_processed(row['id']):
+                continue
+            if not row['sender_found']:
+                logger.error("Sender %s not found for message %s", row['sender_id'], row['id'])
+                continue
+            if not row['recipient_id']:
+                logger.error("No recipient found for message %s", row['id'])
+                continue
+            yield MessageNotification(
+                id=row['id'],
+                conversation_id=row['conversation_id'],
+                sender_name=row['sender_name'],
+                recipient_id=row['recipient_id'],
+                recipient_email=row['recipient_email'],
+                preview=row['preview']
+            )
+
+    def get_conversation_participants(self, conversation_id: str) -> List[UserRecord]:
+        """Get participants of a conversation"""
+        try:
+            with self.connection() as conn:
+                cursor = conn.cursor(row_factory=class_row(UserRecord))
+                return cursor.execute(
+                    """
+                    SELECT u.id::text AS id, u.name, u.email FROM public.conversations c
+                    JOIN public.users u ON u.id IN (c.guest_id, c.host_id)
+                    WHERE c.id = %s
+                    """,
+                    (conversation_id,)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Error getting conversation participants: {e}")
+            return []
+
+    def expire_listings(self) -> List[Dict[str, Any]]:
+        """Mark listings past their end date inactive in bulk and return them with host name and email"""
+        try:
+            with self.connection() as conn:
+                rows = conn.execute(EXPIRE_LISTINGS_QUERY).fetchall()
+            logger.info("Expired %d listings", len(rows))
+            return rows
+        except Exception as e:
+            logger.error(f"Error expiring listings: {e}")
+            return []
+
+    def mark_message_notified(self, message_id: str):
+        """Log that a message notification was sent (no database tracking)"""
+        logger.info("Email notification sent for message %s (not tracked in database)", message_id)
+
+    def get_unread_message_ids(self, message_ids: List[str]) -> Optional[Set[str]]:
+        """Get which of the given messages are still unread, or None if they could not be checked"""
+        try:
+            with self.connection() as conn:
+                rows = conn.execute(
+                    'SELECT id::text AS id FROM public.messages WHERE id = ANY(%s::uuid[]) AND read_at IS NULL',
+                    (message_ids,)
+                ).fetchall()
+            return {row['id'] for row in rows}
+        except Exception as e:
+            logger.error(f"Error checking unread messages: {e}")
+            return None
+
+    def get_suppressed_emails(self) -> Optional[List[str]]:
+        """Get every suppressed recipient address, or None if the table could not be read"""
+        try:
+            with self.connection() as conn:
+                return [row['email'] for row in conn.execute('SELECT email FROM public.email_suppressions')]
+        except Exception as e:
+            logger.error(f"Error getting suppressed emails: {e}")
+            return None
+
+    def add_suppression(self, email: str, reason: str, source: str) -> bool:
+        """Persist a suppressed recipient, keeping the first recorded reason"""
+        try:
+            with self.connection() as conn:
+                conn.execute(
+                    'INSERT INTO public.email_suppressions (email, reason, source) VALUES (%s, %s, %s) ON CONFLICT (email) DO NOTHING',
+                    (email, reason, source)
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error adding suppression for {email}: {e}")
+            return False
+
+    def close(self):
+        """Release pooled connections"""
+        self.pool.close()
@@ -0,0 +1,117 @@
+from shared_state import shared_state
+from circuit_breaker import circuit_breakers, CLOSED, HALF_OPEN, OPEN
+from profiling import phase_timings
+from email_service import email_service
+from config import config
+from typing import Dict, Any, Optional
+import os
+import socket
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+BREAKER_SEVERITY = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class ProcessSnapshots:
+    """Publishes this process's breakers, provider stats and phase timings through shared_state.
+
+    Those live in module globals of each process, so in multi-process mode the
+    API process answering a request would otherwise only see its own. Every
+    process publishes them every `interval` seconds; snapshots older than
+    `max_age` belong to processes that have exited and are dropped.
+    """
+
+    def __init__(self, interval: float, max_age: float):
+        self.interval = interval
+        self.max_age = max_age
+        self.roles = set()
+        self.thread: Optional[threading.Thread] = None
+        self.resets_seen: Optional[int] = None
+
+    @property
+    def label(self) -> str:
+        return f"{socket.gethostname()}:{os.getpid()}"
+
+    def start(self, role: str):
+        """Start publishing; `role` (api or worker) is added to this process's snapshot"""
+        self.roles.add(role)
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='snapshot-publisher', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self._apply_phase_resets()
+                shared_state.publish(f"process:{self.label}", self.snapshot())
+            except Exception as e:
+                logger.error("Error publishing process snapshot: %s", e)
+            time.sleep(self.interval)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'roles': sorted(self.roles),
+            'published_at': time.time(),
+            'breakers': circuit_breakers.snapshot(),
+            'providers': email_service.router.snapshot(),
+            'phases': phase_timings.snapshot()
+        }
+
+    def processes(self) -> Dict[str, Dict[str, Any]]:
+        """Latest snapshot of every live process, with this process's taken fresh"""
+        now = time.time()
+        processes = {}
+        for name, snapshot in shared_state.published('process:').items():
+            if now - snapshot.get('published_at', 0) > self.max_age:
+                shared_state.unpublish(name)
+                continue
+            processes[name[len('process:'):]] = snapshot
+        processes[self.label] = self.snapshot()
+        return processes
+
+    def breakers(self) -> Dict[str, Dict[str, Any]]:
+        """Each breaker in its worst state across processes, with the process reporting it"""
+        merged = {}
+        for label, snapshot in self.processes().items():
+            for name, breaker in snapshot['breakers'].items():
+                current = merged.get(name)
+                if current is None or BREAKER_SEVERITY[breaker['state']] > BREAKER_SEVERITY[current['state']]:
+                    merged[name] = {**breaker, 'process': label}
+        return merged
+
+    def phases(self) -> Dict[str, Any]:
+        """Phase timings summed across processes, plus each process's own"""
+        processes = {label: snapshot['phases'] for label, snapshot in self.processes().items()}
+        total = {}
+        for phases in processes.values():
+            for name, stat in phases.items():
+                merged = total.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+                merged['count'] += stat['count']
+                merged['total_s'] += stat['total_s']
+                merged['max_s'] = max(merged['max_s'], stat['max_s'])
+        for merged in total.values():
+            merged['avg_s'] = merged['total_s'] / merged['count'] if merged['count'] else 0.0
+        return {'total': total, 'processes': processes}
+
+    def reset_phases(self):
+        """Reset phase timings here now, and in other processes on their next publish"""
+        shared_state.incr('debug_phase_resets')
+        phase_timings.reset()
+        self.resets_seen = self._phase_resets()
+
+    def _phase_resets(self) -> int:
+        return shared_state.metrics('debug_phase_resets').get('debug_phase_resets', 0)
+
+    def _apply_phase_resets(self):
+        resets = self._phase_resets()
+        if self.resets_seen is not None and resets != self.resets_seen:
+            phase_timings.reset()
+        self.resets_seen = resets
+
+process_snapshots = ProcessSnapshots(
+    interval=config.SNAPSHOT_PUBLISH_SECONDS,
+    max_age=config.SNAPSHOT_PUBLISH_SECONDS * 3
+)
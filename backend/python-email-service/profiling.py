@@ -0,0 +1,138 @@
+from contextlib import contextmanager
+from collections import Counter
+from typing import Dict, Any, List, Optional
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import logging
+
+logger = logging.getLogger(__name__)
+
+class PhaseTimings:
+    """Cumulative wall-clock timings for named phases of the hot paths"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stat = self.stats.setdefault(name, {'count': 0, 'total_s': 0.0, 'max_s': 0.0})
+                stat['count'] += 1
+                stat['total_s'] += elapsed
+                stat['max_s'] = max(stat['max_s'], elapsed)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {
+                name: {**stat, 'avg_s': stat['total_s'] / stat['count'] if stat['count'] else 0.0}
+                for name, stat in self.stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self.stats.clear()
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+class StackSampler:
+    """Sampling CPU profiler that walks every thread's stack at a fixed interval"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+    def sample(self, seconds: float, interval: float) -> Optional[Counter]:
+        """Sample all threads for `seconds`; returns None if a profile is already running"""
+        if not self._lock.acquire(blocking=False):
+            return None
+        try:
+            me = threading.get_ident()
+            names = {}
+            counts: Counter = Counter()
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == me:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    if thread_id not in names:
+                        names = {t.ident: t.name for t in threading.enumerate()}
+                    stack.append(names.get(thread_id, str(thread_id)))
+                    counts[';'.join(reversed(stack))] += 1
+                time.sleep(interval)
+            return counts
+        finally:
+            self._lock.release()
+
+def format_collapsed(counts: Counter) -> str:
+    """Render stack counts in the collapsed format flamegraph.pl and speedscope read"""
+    return '\n'.join(f"{stack} {count}" for stack, count in counts.most_common()) + '\n'
+
+class MemoryTracker:
+    """tracemalloc snapshots with diffs against a stored baseline"""
+
+    def __init__(self):
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self, frames: int = 1) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.baseline = tracemalloc.take_snapshot()
+        return {'tracing': True, 'frames': tracemalloc.get_traceback_limit()}
+
+    def stop(self) -> Dict[str, Any]:
+        tracemalloc.stop()
+        self.baseline = None
+        return {'tracing': False}
+
+    def _stats_to_rows(self, stats, limit: int) -> List[Dict[str, Any]]:
+        rows = []
+        for stat in stats[:limit]:
+            row = {
+                'location': str(stat.traceback[0]),
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count
+            }
+            if hasattr(stat, 'size_diff'):
+                row['size_diff_kb'] = round(stat.size_diff / 1024, 1)
+                row['count_diff'] = stat.count_diff
+            rows.append(row)
+        return rows
+
+    def top(self, limit: int = 25) -> Dict[str, Any]:
+        """Largest allocation sites right now"""
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        return {
+            'current_kb': round(current / 1024, 1),
+            'peak_kb': round(peak / 1024, 1),
+            'top': self._stats_to_rows(snapshot.statistics('lineno'), limit)
+        }
+
+    def diff(self, limit: int = 25) -> Dict[str, Any]:
+        """Allocation sites that grew the most since the baseline, then move the baseline"""
+        snapshot = tracemalloc.take_snapshot()
+        stats = snapshot.compare_to(self.baseline, 'lineno') if self.baseline else snapshot.statistics('lineno')
+        self.baseline = snapshot
+        return {'top': self._stats_to_rows(stats, limit)}
+
+phase_timings = PhaseTimings()
+stack_sampler = StackSampler()
+memory_tracker = MemoryTracker()
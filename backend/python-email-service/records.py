@@ -0,0 +1,33 @@
+from dataclasses import dataclass
+from config import config
+from typing import Optional, Dict, Any
+
+# Column projections matching the record fields below
+USER_COLUMNS = 'id,name,email'
+MESSAGE_COLUMNS = 'id,conversation_id,sender_id,body'
+
+def make_preview(body: Optional[str]) -> str:
+    """Truncate a message body to the preview shown in notification emails"""
+    body = body or ''
+    limit = config.MESSAGE_PREVIEW_LENGTH
+    return body[:limit] + ('...' if len(body) > limit else '')
+
+@dataclass(slots=True)
+class UserRecord:
+    id: str
+    name: Optional[str]
+    email: Optional[str]
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> 'UserRecord':
+        return cls(id=row['id'], name=row.get('name'), email=row.get('email'))
+
+@dataclass(slots=True)
+class MessageNotification:
+    """A new message with just what the notification email needs"""
+    id: str
+    conversation_id: str
+    sender_name: Optional[str]
+    recipient_id: str
+    recipient_email: Optional[str]
+    preview: str
@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from collections import deque
+from circuit_breaker import circuit_breakers
+from shared_state import shared_state
+from typing import Callable, Collection, Dict, List, Optional, Any
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+SendFunction = Callable[[str, str, str], bool]
+
+class PermanentFailure(Exception):
+    """The recipient is undeliverable on any provider"""
+
+class ProviderStats:
+    """Rolling latency and error estimate for one email provider"""
+
+    def __init__(self, alpha: float = 0.2, error_half_life: float = 60, window: int = 200):
+        self._lock = threading.Lock()
+        self.alpha = alpha
+        self.error_half_life = error_half_life
+        self.latencies = deque(maxlen=window)
+        self.ewma_latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.updated_at = time.monotonic()
+        self.sent = 0
+        self.failed = 0
+
+    def _decayed_error_rate(self, now: float) -> float:
+        # Errors fade while a provider gets no traffic, so a demoted provider is retried eventually
+        return self.error_rate * 0.5 ** ((now - self.updated_at) / self.error_half_life)
+
+    def record(self, latency: float, ok: bool):
+        now = time.monotonic()
+        with self._lock:
+            self.error_rate = self._decayed_error_rate(now) * (1 - self.alpha) + (0 if ok else self.alpha)
+            self.updated_at = now
+            if ok:
+                self.sent += 1
+                self.latencies.append(latency)
+                if self.ewma_latency is None:
+                    self.ewma_latency = latency
+                else:
+                    self.ewma_latency += self.alpha * (latency - self.ewma_latency)
+            else:
+                self.failed += 1
+
+    def score(self, default_latency: float, error_penalty: float) -> float:
+        """Expected cost of a send in seconds; lower is better"""
+        with self._lock:
+            latency = self.ewma_latency if self.ewma_latency is not None else default_latency
+            return latency + error_penalty * self._decayed_error_rate(time.monotonic())
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.percentile(0.95)
+        with self._lock:
+            return {
+                'sent': self.sent,
+                'failed': self.failed,
+                'error_rate': round(self._decayed_error_rate(time.monotonic()), 4),
+                'ewma_latency_s': round(self.ewma_latency, 4) if self.ewma_latency is not None else None,
+                'p95_latency_s': round(p95, 4) if p95 is not None else None,
+                'samples': len(self.latencies)
+            }
+
+class ProviderRouter:
+    """Routes each send to the provider with the lowest expected cost and fails over on errors.
+
+    With hedging enabled, a duplicate send goes to the next provider once the first
+    one has been running longer than its own p95 latency, and the first success wins.
+    """
+
+    def __init__(self, providers: Dict[str, SendFunction], default_latency: float, error_penalty: float,
+                 error_half_life: float, hedge: bool = False, hedge_min_samples: int = 20, hedge_workers: int = 8,
+                 is_permanent: Optional[Callable[[str], bool]] = None):
+        self.providers = providers
+        self.stats = {name: ProviderStats(error_half_life=error_half_life) for name in providers}
+        for name in providers:
+            circuit_breakers.get(name)
+        self.order = list(providers)
+        self.default_latency = default_latency
+        self.error_penalty = error_penalty
+        self.hedge = hedge and len(providers) > 1
+        self.hedge_min_samples = hedge_min_samples
+        self.is_permanent = is_permanent
+        self.pool = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='email-hedge') if self.hedge else None
+
+    def ranked(self) -> List[str]:
+        """Providers whose breaker admits calls, healthiest first; configured order breaks ties"""
+        return sorted(
+            (name for name in self.order if circuit_breakers.get(name).available()),
+            key=lambda name: (self.stats[name].score(self.default_latency, self.error_penalty), self.order.index(name))
+        )
+
+    def attempt(self, name: str, to_email: str, subject: str, html_content: str) -> bool:
+        if not circuit_breakers.get(name).allow():
+            return False
+        start = time.perf_counter()
+        try:
+            ok = self.providers[name](to_email, subject, html_content)
+        except Exception as e:
+            logger.error("Provider %s raised sending to %s: %s", name, to_email, e)
+            ok = False
+        if not ok and self.is_permanent and self.is_permanent(to_email):
+            # The recipient was rejected, not the provider; don't penalise it or retry elsewhere
+            self.record(name, time.perf_counter() - start, True)
+            raise PermanentFailure(to_email)
+        self.record(name, time.perf_counter() - start, ok)
+        return ok
+
+    def record(self, name: str, latency: float, ok: bool):
+        """Record the outcome of a send, including ones made outside the router (e.g. a batch)"""
+        self.stats[name].record(latency, ok)
+        breaker = circuit_breakers.get(name)
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+    def hedge_deadline(self, name: str) -> Optional[float]:
+        stats = self.stats[name]
+        if len(stats.latencies) < self.hedge_min_samples:
+            return None
+        return stats.percentile(0.95)
+
+    def send(self, to_email: str, subject: str, html_content: str, exclude: Collection[str] = ()) -> bool:
+        """Send through the best provider, failing over down the ranking.
+
+        Providers in `exclude` already failed this email elsewhere (e.g. in a batch),
+        so the first attempt on another provider counts as a failover too.
+        """
+        ranked = [name for name in self.ranked() if name not in exclude]
+        try:
+            if self.hedge:
+                return self._send_hedged(ranked, to_email, subject, html_content, failed_over=bool(exclude))
+            for position, name in enumerate(ranked):
+                if position or exclude:
+                    logger.warning("Failing over to %s for %s", name, to_email)
+                    shared_state.incr('emails_failover')
+                if self.attempt(name, to_email, subject, html_content):
+                    return True
+        except PermanentFailure:
+            return False
+        return False
+
+    def _send_hedged(self, ranked: List[str], to_email: str, subject: str, html_content: str, failed_over: bool = False) -> bool:
+        remaining = list(ranked)
+        pending = set()
+        while remaining or pending:
+            if remaining and not pending:
+                if failed_over or len(remaining) < len(ranked):
+                    logger.warning("Failing over to %s for %s", remaining[0], to_email)
+                    shared_state.incr('emails_failover')
+                name = remaining.pop(0)
+                pending.add(self.pool.submit(self.attempt, name, to_email, subject, html_content))
+                deadline = self.hedge_deadline(name)
+            else:
+                deadline = None
+            done, pending = wait(pending, timeout=deadline if remaining else None, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.result():
+                    return True
+            if not done and remaining:
+                # Primary is past its p95: race a duplicate on the next provider
+                name = remaining.pop(0)
+                logger.info("Hedging send to %s on %s", to_email, name)
+                shared_state.incr('emails_hedged')
+                pending.add(self.pool.submit(self.attempt, name, to_email, subject, html_content))
+        return False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'ranking': self.ranked(),
+            'hedge': self.hedge,
+            'providers': {
+                name: {**stats.snapshot(), 'breaker': circuit_breakers.get(name).state}
+                for name, stats in self.stats.items()
+            }
+        }
@@ -0,0 +1,347 @@
+from config import config
+from database import db
+from email_service import email_service
+from shared_state import shared_state
+from suppression import suppression_list
+from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, Callable
+import heapq
+import json
+import sqlite3
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class ScheduledJob:
+    """A notification to hand to EmailService at `due_at` (unix seconds)"""
+    id: str
+    due_at: float
+    type: str
+    payload: Dict[str, Any]
+    condition: Optional[Dict[str, Any]] = None
+    attempts: int = 0
+
+class SqliteScheduleStore:
+    """Durable job store in a local SQLite file, indexed on due time"""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS scheduled_jobs (
+                id TEXT PRIMARY KEY,
+                due_at REAL NOT NULL,
+                type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                condition TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        self.conn.execute('CREATE INDEX IF NOT EXISTS scheduled_jobs_due_at_idx ON scheduled_jobs (due_at)')
+
+    def add_many(self, jobs: List[ScheduledJob]):
+        rows = [
+            (job.id, job.due_at, job.type, json.dumps(job.payload), json.dumps(job.condition) if job.condition else None)
+            for job in jobs
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO scheduled_jobs (id, due_at, type, payload, condition) VALUES (?, ?, ?, ?, ?)', rows
+            )
+
+    def due_before(self, until: float, limit: int) -> List[Tuple[float, str]]:
+        with self._lock:
+            return self.conn.execute(
+                'SELECT due_at, id FROM scheduled_jobs WHERE due_at <= ? ORDER BY due_at LIMIT ?', (until, limit)
+            ).fetchall()
+
+    def claim(self, ids: List[str], now: float, lease_until: float) -> List[ScheduledJob]:
+        """Push due jobs' due time out by the lease and return them; cancelled or not-yet-due ids are skipped"""
+        placeholders = ','.join('?' * len(ids))
+        with self._lock, self.conn:
+            rows = self.conn.execute(
+                f'SELECT id, due_at, type, payload, condition, attempts FROM scheduled_jobs WHERE id IN ({placeholders}) AND due_at <= ?',
+                (*ids, now)
+            ).fetchall()
+            self.conn.executemany(
+                'UPDATE scheduled_jobs SET due_at = ?, attempts = attempts + 1 WHERE id = ?',
+                [(lease_until, row[0]) for row in rows]
+            )
+        return [
+            ScheduledJob(job_id, due_at, event_type, json.loads(payload), json.loads(condition) if condition else None, attempts + 1)
+            for job_id, due_at, event_type, payload, condition, attempts in rows
+        ]
+
+    def complete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock, self.conn:
+            self.conn.executemany('DELETE FROM scheduled_jobs WHERE id = ?', [(job_id,) for job_id in ids])
+
+    def cancel(self, job_id: str) -> bool:
+        with self._lock, self.conn:
+            return self.conn.execute('DELETE FROM scheduled_jobs WHERE id = ?', (job_id,)).rowcount > 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            pending, next_due = self.conn.execute('SELECT COUNT(*), MIN(due_at) FROM scheduled_jobs').fetchone()
+        return {'pending': pending, 'next_due_at': next_due}
+
+class RedisScheduleStore:
+    """Durable job store in Redis: a sorted set of ids by due time plus a hash of job bodies.
+
+    Claiming is not atomic across processes; only the worker process runs the scheduler.
+    """
+
+    def __init__(self, url: str, namespace: str = 'subly-email'):
+        import redis
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=config.SHARED_STATE_TIMEOUT,
+            socket_connect_timeout=config.SHARED_STATE_TIMEOUT,
+            decode_responses=True
+        )
+        self.due_key = f"{namespace}:scheduled:due"
+        self.jobs_key = f"{namespace}:scheduled:jobs"
+
+    def add_many(self, jobs: List[ScheduledJob]):
+        pipe = self.client.pipeline()
+        for job in jobs:
+            pipe.hset(self.jobs_key, job.id, json.dumps({
+                'type': job.type, 'payload': job.payload, 'condition': job.condition, 'attempts': 0
+            }))
+            pipe.zadd(self.due_key, {job.id: job.due_at})
+        pipe.execute()
+
+    def due_before(self, until: float, limit: int) -> List[Tuple[float, str]]:
+        return [
+            (due_at, job_id)
+            for job_id, due_at in self.client.zrangebyscore(self.due_key, '-inf', until, start=0, num=limit, withscores=True)
+        ]
+
+    def claim(self, ids: List[str], now: float, lease_until: float) -> List[ScheduledJob]:
+        """Push due jobs' due time out by the lease and return them; cancelled or not-yet-due ids are skipped"""
+        pipe = self.client.pipeline()
+        for job_id in ids:
+            pipe.zscore(self.due_key, job_id)
+        pipe.hmget(self.jobs_key, ids)
+        *scores, bodies = pipe.execute()
+        jobs = []
+        pipe = self.client.pipeline()
+        for job_id, due_at, body in zip(ids, scores, bodies):
+            if due_at is None or due_at > now or body is None:
+                continue
+            data = json.loads(body)
+            data['attempts'] += 1
+            pipe.zadd(self.due_key, {job_id: lease_until}, xx=True)
+            pipe.hset(self.jobs_key, job_id, json.dumps(data))
+            jobs.append(ScheduledJob(job_id, due_at, data['type'], data['payload'], data['condition'], data['attempts']))
+        pipe.execute()
+        return jobs
+
+    def complete(self, ids: List[str]):
+        if not ids:
+            return
+        pipe = self.client.pipeline()
+        pipe.zrem(self.due_key, *ids)
+        pipe.hdel(self.jobs_key, *ids)
+        pipe.execute()
+
+    def cancel(self, job_id: str) -> bool:
+        pipe = self.client.pipeline()
+        pipe.zrem(self.due_key, job_id)
+        pipe.hdel(self.jobs_key, job_id)
+        return bool(pipe.execute()[0])
+
+    def stats(self) -> Dict[str, Any]:
+        pending = self.client.zcard(self.due_key)
+        first = self.client.zrange(self.due_key, 0, 0, withscores=True)
+        return {'pending': pending, 'next_due_at': first[0][1] if first else None}
+
+class DeliveryScheduler:
+    """Releases scheduled notifications into EmailService in batches when they fall due.
+
+    Every job lives in the durable store; only jobs due within the next
+    `horizon` seconds are held in an in-memory heap, so the number of pending
+    jobs doesn't affect memory or wake-ups. A claimed job's due time is pushed
+    out by `lease` seconds until it has been sent, so jobs whose send failed, or
+    that were claimed by a process that died, are released again.
+    """
+
+    def __init__(self, store_factory: Callable[[], Any], horizon: float, poll_interval: float, batch_size: int, lease: float, max_attempts: int):
+        self.store_factory = store_factory
+        self._store = None
+        self._store_lock = threading.Lock()
+        self.horizon = horizon
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self._wakeup = threading.Condition()
+        self.heap: List[Tuple[float, str]] = []
+        self.queued = set()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def store(self):
+        """The job store, opened on first use so importing this module creates no files"""
+        with self._store_lock:
+            if self._store is None:
+                self._store = self.store_factory()
+            return self._store
+
+    def schedule(self, event_type: str, payload: Dict[str, Any], due_at: float, condition: Optional[Dict[str, Any]] = None) -> str:
+        """Persist one job and return its id"""
+        return self.schedule_many([(event_type, payload, due_at, condition)])[0]
+
+    def schedule_many(self, items: List[Tuple[str, Dict[str, Any], float, Optional[Dict[str, Any]]]]) -> List[str]:
+        """Persist (type, payload, due_at, condition) jobs in one write"""
+        jobs = [ScheduledJob(uuid.uuid4().hex, due_at, event_type, payload, condition) for event_type, payload, due_at, condition in items]
+        self.store.add_many(jobs)
+        shared_state.incr('scheduled_added', len(jobs))
+        if self.thread:
+            # Jobs inside the horizon go straight onto this process's heap
+            until = time.time() + self.horizon
+            with self._wakeup:
+                for job in jobs:
+                    if job.due_at <= until:
+                        self._push(job.due_at, job.id)
+                self._wakeup.notify()
+        return [job.id for job in jobs]
+
+    def cancel(self, job_id: str) -> bool:
+        return self.store.cancel(job_id)
+
+    def start(self):
+        """Start releasing jobs; call from exactly one process"""
+        if self.thread:
+            return
+        self.thread = threading.Thread(target=self._run, name='delivery-scheduler', daemon=True)
+        self.thread.start()
+        logger.info("Delivery scheduler started")
+
+    def _push(self, due_at: float, job_id: str):
+        if job_id not in self.queued:
+            self.queued.add(job_id)
+            heapq.heappush(self.heap, (due_at, job_id))
+
+    def _refill(self, now: float):
+        """Load jobs due within the horizon from the store"""
+        try:
+            due = self.store.due_before(now + self.horizon, self.batch_size * 10)
+        except Exception as e:
+            logger.error("Error loading scheduled jobs: %s", e)
+            return
+        with self._wakeup:
+            for due_at, job_id in due:
+                self._push(due_at, job_id)
+
+    def _run(self):
+        next_refill = 0.0
+        while True:
+            try:
+                now = time.time()
+                if now >= next_refill:
+                    self._refill(now)
+                    next_refill = now + self.poll_interval
+                with self._wakeup:
+                    ids = []
+                    while self.heap and self.heap[0][0] <= now and len(ids) < self.batch_size:
+                        ids.append(heapq.heappop(self.heap)[1])
+                    self.queued.difference_update(ids)
+                    if not ids:
+                        next_due = self.heap[0][0] if self.heap else next_refill
+                        self._wakeup.wait(max(0.0, min(next_due, next_refill) - now))
+                        continue
+                self.release(ids, now)
+                if not self.heap:
+                    # Keep draining a backlog without waiting for the next poll
+                    next_refill = 0.0
+            except Exception as e:
+                logger.exception("Error in delivery scheduler: %s", e)
+                time.sleep(self.poll_interval)
+
+    def release(self, ids: List[str], now: float):
+        """Claim due jobs and send them through EmailService"""
+        jobs = self.store.claim(ids, now, now + self.lease)
+        done, pending = [], []
+        for job in jobs:
+            if job.attempts > self.max_attempts:
+                logger.error("Dropping scheduled %s job %s after %d attempts", job.type, job.id, job.attempts - 1)
+                shared_state.incr('scheduled_dropped')
+                done.append(job.id)
+            else:
+                pending.append(job)
+
+        # Conditional jobs: only send message notifications that are still unread
+        message_ids = [job.condition['unread_message_id'] for job in pending if job.condition and 'unread_message_id' in job.condition]
+        unread = db.get_unread_message_ids(message_ids) if message_ids else set()
+        if unread is None:
+            # Couldn't check; leave conditional jobs to be retried when their lease runs out
+            pending = [job for job in pending if not (job.condition and 'unread_message_id' in job.condition)]
+        to_send = []
+        for job in pending:
+            message_id = (job.condition or {}).get('unread_message_id')
+            if message_id and message_id not in unread:
+                shared_state.incr('scheduled_skipped')
+                done.append(job.id)
+            else:
+                to_send.append(job)
+
+        # Only sent or suppressed jobs are completed; failed ones keep their lease and
+        # are released again when it runs out, until they reach max_attempts
+        sent = failed = 0
+        expired = [job for job in to_send if job.type == 'listing_expired']
+        if expired:
+            # One render pass and provider session for the whole release
+            result = email_service.send_listing_expired_notifications([job.payload for job in expired], batch_size=self.batch_size)
+            sent += result['sent']
+            failed += result['failed']
+            done.extend(job.id for job, ok in zip(expired, result['results']) if ok is not False)
+        for job in to_send:
+            if job.type == 'listing_expired':
+                continue
+            try:
+                if email_service.notification_senders[job.type](**job.payload):
+                    sent += 1
+                    done.append(job.id)
+                elif suppression_list.is_suppressed(job.payload.get('recipient_email')):
+                    done.append(job.id)
+                else:
+                    failed += 1
+            except Exception as e:
+                logger.error("Error sending scheduled %s job %s: %s", job.type, job.id, e)
+                failed += 1
+
+        self.store.complete(done)
+        shared_state.incr('scheduled_sent', sent)
+        shared_state.incr('scheduled_failed', failed)
+        logger.info("Released %d scheduled jobs: %d sent, %d failed and left for retry", len(jobs), sent, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            stats = self.store.stats()
+        except Exception as e:
+            logger.error("Error reading scheduler stats: %s", e)
+            stats = {}
+        return {**stats, 'in_memory': len(self.heap), **shared_state.metrics('scheduled_')}
+
+def create_schedule_store():
+    """Create the job store selected by SCHEDULE_STORE"""
+    if config.SCHEDULE_STORE == "redis":
+        return RedisScheduleStore(config.REDIS_URL)
+    return SqliteScheduleStore(config.SCHEDULE_DB_PATH)
+
+delivery_scheduler = DeliveryScheduler(
+    create_schedule_store,
+    horizon=config.SCHEDULER_HORIZON_SECONDS,
+    poll_interval=config.SCHEDULER_POLL_SECONDS,
+    batch_size=config.SCHEDULER_BATCH_SIZE,
+    lease=config.SCHEDULER_LEASE_SECONDS,
+    max_attempts=config.SCHEDULER_MAX_ATTEMPTS
+)
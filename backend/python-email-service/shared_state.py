@@ -0,0 +1,125 @@
+from config import config
+from collections import Counter
+from typing import Dict, Any
+import threading
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+class MemoryState:
+    """Dedup set and counters for a single process"""
+
+    def __init__(self, max_processed: int = 1000):
+        self._lock = threading.Lock()
+        self.max_processed = max_processed
+        self.processed = set()
+        self.counters: Counter = Counter()
+        self.snapshots: Dict[str, Dict[str, Any]] = {}
+
+    def is_processed(self, key: str) -> bool:
+        return key in self.processed
+
+    def mark_processed(self, key: str) -> bool:
+        """Record a processed id; returns False if it was already recorded"""
+        with self._lock:
+            if key in self.processed:
+                return False
+            # Clear periodically to prevent memory leaks
+            if len(self.processed) >= self.max_processed:
+                self.processed.clear()
+            self.processed.add(key)
+            return True
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def metrics(self, prefix: str = '') -> Dict[str, int]:
+        with self._lock:
+            return {name: value for name, value in self.counters.items() if name.startswith(prefix)}
+
+    def publish(self, name: str, snapshot: Dict[str, Any]):
+        """Store a JSON-serialisable snapshot under a name, replacing the previous one"""
+        with self._lock:
+            self.snapshots[name] = json.loads(json.dumps(snapshot, default=str))
+
+    def published(self, prefix: str = '') -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {name: value for name, value in self.snapshots.items() if name.startswith(prefix)}
+
+    def unpublish(self, name: str):
+        with self._lock:
+            self.snapshots.pop(name, None)
+
+class RedisState:
+    """Dedup set and counters shared by every process through Redis"""
+
+    def __init__(self, url: str, namespace: str = 'subly-email'):
+        import redis
+        self.client = redis.Redis.from_url(
+            url,
+            socket_timeout=config.SHARED_STATE_TIMEOUT,
+            socket_connect_timeout=config.SHARED_STATE_TIMEOUT,
+            decode_responses=True
+        )
+        self.namespace = namespace
+        self.processed_ttl = config.PROCESSED_TTL_SECONDS
+
+    def is_processed(self, key: str) -> bool:
+        try:
+            return bool(self.client.exists(f"{self.namespace}:processed:{key}"))
+        except Exception as e:
+            logger.error(f"Error checking processed id {key}: {e}")
+            return False
+
+    def mark_processed(self, key: str) -> bool:
+        """Record a processed id; returns False if it was already recorded"""
+        try:
+            return bool(self.client.set(f"{self.namespace}:processed:{key}", 1, nx=True, ex=self.processed_ttl))
+        except Exception as e:
+            logger.error(f"Error marking processed id {key}: {e}")
+            return True
+
+    def incr(self, name: str, amount: int = 1):
+        try:
+            self.client.hincrby(f"{self.namespace}:metrics", name, amount)
+        except Exception as e:
+            logger.error(f"Error incrementing metric {name}: {e}")
+
+    def metrics(self, prefix: str = '') -> Dict[str, int]:
+        try:
+            counters = self.client.hgetall(f"{self.namespace}:metrics")
+        except Exception as e:
+            logger.error(f"Error reading metrics: {e}")
+            return {}
+        return {name: int(value) for name, value in counters.items() if name.startswith(prefix)}
+
+    def publish(self, name: str, snapshot: Dict[str, Any]):
+        """Store a JSON-serialisable snapshot under a name, replacing the previous one"""
+        try:
+            self.client.hset(f"{self.namespace}:snapshots", name, json.dumps(snapshot, default=str))
+        except Exception as e:
+            logger.error(f"Error publishing snapshot {name}: {e}")
+
+    def published(self, prefix: str = '') -> Dict[str, Dict[str, Any]]:
+        try:
+            snapshots = self.client.hgetall(f"{self.namespace}:snapshots")
+        except Exception as e:
+            logger.error(f"Error reading snapshots: {e}")
+            return {}
+        return {name: json.loads(value) for name, value in snapshots.items() if name.startswith(prefix)}
+
+    def unpublish(self, name: str):
+        try:
+            self.client.hdel(f"{self.namespace}:snapshots", name)
+        except Exception as e:
+            logger.error(f"Error removing snapshot {name}: {e}")
+
+def create_shared_state():
+    """Create the state backend selected by SHARED_STATE_BACKEND"""
+    if config.SHARED_STATE_BACKEND == "redis":
+        return RedisState(config.REDIS_URL)
+    return MemoryState()
+
+shared_state = create_shared_state()
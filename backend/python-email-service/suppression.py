@@ -0,0 +1,113 @@
+from config import config
+from database import db
+from shared_state import shared_state
+from typing import Dict, Any, List, Iterable, Optional, Tuple, Union
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# SendGrid event types that mean an address should not be mailed again
+SENDGRID_SUPPRESS_EVENTS = {'bounce', 'dropped', 'spamreport'}
+
+def normalize_email(email: Optional[str]) -> str:
+    return (email or '').strip().lower()
+
+class SuppressionList:
+    """In-memory index of suppressed recipients backed by the email_suppressions table.
+
+    Lookups only hit a local set. A background thread, started by the first
+    lookup, reloads the set from the store every SUPPRESSION_REFRESH_SECONDS so
+    entries added by other processes show up without a sender ever waiting on it.
+    """
+
+    def __init__(self, store, refresh_seconds: float):
+        self.store = store
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self.emails = set()
+        self.added = set()
+        self.loaded_at: Optional[float] = None
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Start the background reload; the first load happens straight away"""
+        with self._lock:
+            if self.thread:
+                return
+            self.thread = threading.Thread(target=self._run, name='suppression-refresh', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error("Error refreshing suppression list: %s", e)
+            time.sleep(self.refresh_seconds)
+
+    def refresh(self):
+        """Reload the index from the store, keeping addresses added while it loaded"""
+        with self._lock:
+            self.added = set()
+        emails = self.store.get_suppressed_emails()
+        if emails is None:
+            # On a failed load keep the old index and retry after the next interval
+            return
+        loaded = {normalize_email(email) for email in emails}
+        with self._lock:
+            self.emails = loaded | self.added
+            self.loaded_at = time.monotonic()
+        logger.info("Loaded %d suppressed addresses", len(loaded))
+
+    def is_suppressed(self, email: Optional[str]) -> bool:
+        if self.thread is None:
+            self.start()
+        return normalize_email(email) in self.emails
+
+    def add(self, email: str, reason: str, source: str) -> bool:
+        """Suppress an address locally and persist it; returns False if it was already suppressed"""
+        email = normalize_email(email)
+        with self._lock:
+            if not email or email in self.emails:
+                return False
+            self.emails.add(email)
+            self.added.add(email)
+        self.store.add_suppression(email, reason, source)
+        shared_state.incr('suppressions_added')
+        logger.warning("Suppressed %s (%s from %s)", email, reason, source)
+        return True
+
+    def record_smtp_refusals(self, refused: Dict[str, Tuple[int, Union[bytes, str]]]) -> int:
+        """Suppress recipients an SMTP server refused with a permanent (5xx) reply"""
+        added = 0
+        for email, (code, message) in refused.items():
+            if 500 <= code < 600:
+                if isinstance(message, bytes):
+                    message = message.decode(errors='replace')
+                added += self.add(email, f"smtp {code} {message}"[:500], 'smtp')
+        return added
+
+    def record_sendgrid_events(self, events: Iterable[Dict[str, Any]]) -> int:
+        """Suppress recipients from SendGrid event webhook payloads"""
+        added = 0
+        for event in events:
+            event_type = event.get('event')
+            if event_type not in SENDGRID_SUPPRESS_EVENTS:
+                continue
+            # Blocks are usually temporary reputation issues on the receiving side
+            if event_type == 'bounce' and event.get('type') == 'blocked':
+                continue
+            reason = event.get('reason') or event_type
+            added += self.add(event.get('email'), f"{event_type}: {reason}"[:500], 'sendgrid')
+        return added
+
+    def filter(self, emails: List[str]) -> List[bool]:
+        """Suppression flags for many addresses"""
+        if self.thread is None:
+            self.start()
+        suppressed = self.emails
+        return [normalize_email(email) in suppressed for email in emails]
+
+suppression_list = SuppressionList(db, config.SUPPRESSION_REFRESH_SECONDS)
@@ -0,0 +1,111 @@
+from postgrest import SyncPostgrestClient, AsyncPostgrestClient
+from postgrest.utils import SyncClient
+from httpx import AsyncClient, AsyncHTTPTransport, HTTPTransport, Limits, Request, Response, Timeout, TransportError
+from circuit_breaker import circuit_breakers
+from config import config
+from typing import Dict, Optional, Union
+import importlib.util
+import logging
+
+logger = logging.getLogger(__name__)
+
+def http2_available() -> bool:
+    """HTTP/2 needs the optional h2 package on top of httpx"""
+    return config.SUPABASE_HTTP2 and importlib.util.find_spec('h2') is not None
+
+def build_timeout() -> Timeout:
+    """Per-request timeout applied to every PostgREST query"""
+    return Timeout(
+        config.SUPABASE_TIMEOUT,
+        connect=config.SUPABASE_CONNECT_TIMEOUT,
+        pool=config.SUPABASE_CONNECT_TIMEOUT
+    )
+
+def build_limits() -> Limits:
+    """Keep-alive connection pool sizing shared by the sync and async clients"""
+    return Limits(
+        max_connections=config.SUPABASE_POOL_SIZE,
+        max_keepalive_connections=config.SUPABASE_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=config.SUPABASE_KEEPALIVE_EXPIRY
+    )
+
+def rest_headers(key: Optional[str] = None) -> Dict[str, str]:
+    """Same auth headers supabase.create_client sends to PostgREST; the anon key unless another is given"""
+    key = key or config.SUPABASE_KEY
+    return {
+        "apiKey": key,
+        "Authorization": f"Bearer {key}",
+    }
+
+def rest_url() -> str:
+    return f"{config.SUPABASE_URL}/rest/v1"
+
+class BreakerTransport(HTTPTransport):
+    """HTTP transport that fails fast while the Supabase breaker is open.
+
+    Connection errors, timeouts and 5xx responses count as failures.
+    """
+
+    def handle_request(self, request: Request) -> Response:
+        breaker = circuit_breakers.get('supabase')
+        breaker.check()
+        try:
+            response = super().handle_request(request)
+        except TransportError:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+class AsyncBreakerTransport(AsyncHTTPTransport):
+    """Async counterpart of BreakerTransport, sharing the same breaker"""
+
+    async def handle_async_request(self, request: Request) -> Response:
+        breaker = circuit_breakers.get('supabase')
+        breaker.check()
+        try:
+            response = await super().handle_async_request(request)
+        except TransportError:
+            breaker.record_failure()
+            raise
+        if response.status_code >= 500:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return response
+
+class TunedSyncPostgrestClient(SyncPostgrestClient):
+    """PostgREST client with a sized keep-alive pool, optional HTTP/2 and a circuit breaker"""
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout: Union[int, float, Timeout]) -> SyncClient:
+        return SyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=BreakerTransport(limits=build_limits(), http2=http2_available())
+        )
+
+class TunedAsyncPostgrestClient(AsyncPostgrestClient):
+    """Async PostgREST client with the same pool and timeout settings"""
+
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout: Union[int, float, Timeout]) -> AsyncClient:
+        return AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            transport=AsyncBreakerTransport(limits=build_limits(), http2=http2_available())
+        )
+
+def create_rest_client(key: Optional[str] = None) -> TunedSyncPostgrestClient:
+    """Create the blocking PostgREST client used by the worker, authenticated with `key` or the anon key"""
+    logger.info("Creating Supabase REST client (pool=%d, http2=%s)", config.SUPABASE_POOL_SIZE, http2_available())
+    circuit_breakers.get('supabase')
+    return TunedSyncPostgrestClient(rest_url(), headers=rest_headers(key), timeout=build_timeout())
+
+def create_async_rest_client() -> TunedAsyncPostgrestClient:
+    """Create the non-blocking PostgREST client used by FastAPI handlers"""
+    logger.info("Creating async Supabase REST client (pool=%d, http2=%s)", config.SUPABASE_POOL_SIZE, http2_available())
+    return TunedAsyncPostgrestClient(rest_url(), headers=rest_headers(), timeout=build_timeout())